@@ -0,0 +1,215 @@
+// AI-generated definitions for a deck topic, streamed to clients as they are produced.
+//
+// - Backends are async generators of raw model text: 'gemini' streams from
+//   streamGenerateContent, 'stub' produces canned definitions locally (for load tests).
+// - The model's JSON array is parsed incrementally, so each definition is forwarded as soon
+//   as its closing quote/brace arrives instead of after the whole response.
+// - Finished results are cached in SQLite (ai_definitions_cache) with a TTL, keyed by
+//   deck name and PROMPT_VERSION.
+// - Concurrent requests for the same deck share one upstream call; late joiners get the
+//   definitions produced so far replayed, then the rest live.
+
+// Bump when the prompt or generation settings change, so old cached answers are not reused
+const PROMPT_VERSION = 1;
+
+const GEMINI_STREAM_URL = 'https://gemini-proxy.sezoran01.workers.dev/v1beta/models/gemini-2.0-flash:streamGenerateContent';
+
+const CACHE_TABLE = `
+	CREATE TABLE IF NOT EXISTS ai_definitions_cache (
+		deck_name TEXT NOT NULL,
+		prompt_version INTEGER NOT NULL,
+		definitions TEXT NOT NULL,      -- JSON array, as streamed to clients
+		created_at INTEGER NOT NULL,    -- Unix epoch seconds
+		PRIMARY KEY (deck_name, prompt_version)
+	) WITHOUT ROWID
+`;
+
+const buildPrompt = (deckName) =>
+	`Сгенерируйте 5 кратких технически точных определений простыми словами, ключевых терминов для темы "${deckName}", без аналогий. Верните результат в виде JSON-массива. На русском языке.`;
+
+// --- Backends ---
+
+// Streams text deltas from Gemini (server-sent events via ?alt=sse)
+const geminiBackend = ({ apiKey, safetySettings }) => async function* (prompt) {
+	const response = await fetch(`${GEMINI_STREAM_URL}?alt=sse&key=${apiKey}`, {
+		method: 'POST', headers: { 'Content-Type': 'application/json' },
+		body: JSON.stringify({
+			contents: [{ parts: [{ text: prompt }] }],
+			generationConfig: { temperature: 0.1, topP: 0.95, topK: 0 },
+			safetySettings
+		})
+	});
+	if (!response.ok) {
+		const errorText = await response.text();
+		throw new Error(`API request failed with status ${response.status}: ${errorText}`);
+	}
+
+	const decoder = new TextDecoder();
+	let buffer = '';
+	for await (const chunk of response.body) {
+		buffer += decoder.decode(chunk, { stream: true });
+		let newline;
+		while ((newline = buffer.indexOf('\n')) !== -1) {
+			const line = buffer.slice(0, newline).trim();
+			buffer = buffer.slice(newline + 1);
+			if (!line.startsWith('data:')) continue;
+			const event = JSON.parse(line.slice(5));
+			const text = event?.candidates?.[0]?.content?.parts?.[0]?.text;
+			if (text) yield text;
+		}
+	}
+};
+
+// Local stand-in for load testing: emits a JSON array in small chunks with a fixed delay
+const stubBackend = ({ delayMs = 50, count = 5 } = {}) => async function* (prompt) {
+	const topic = prompt.match(/"([^"]*)"/)?.[1] || 'topic';
+	const text = JSON.stringify(
+		Array.from({ length: count }, (_, i) => `${topic}: stub definition ${i + 1}`)
+	);
+	for (let i = 0; i < text.length; i += 16) {
+		await new Promise(resolve => setTimeout(resolve, delayMs));
+		yield text.slice(i, i + 16);
+	}
+};
+
+// --- Incremental parsing ---
+
+// Feed model text in chunks; calls onItem for each complete top-level element of the first
+// JSON array in the text (anything before it, such as a ```json fence, is skipped).
+const createArrayItemParser = (onItem) => {
+	let text = '';
+	let pos = 0;
+	let depth = 0;          // Bracket depth; 1 = directly inside the top-level array
+	let inString = false;
+	let escaped = false;
+	let itemStart = -1;
+	let finished = false;
+
+	const emit = (end) => {
+		const raw = text.slice(itemStart, end).trim();
+		itemStart = -1;
+		if (!raw) return;
+		try { onItem(JSON.parse(raw)); } catch { onItem(raw); }
+	};
+
+	return {
+		push(chunk) {
+			text += chunk;
+			for (; pos < text.length && !finished; pos++) {
+				const ch = text[pos];
+				if (inString) {
+					if (escaped) escaped = false;
+					else if (ch === '\\') escaped = true;
+					else if (ch === '"') {
+						inString = false;
+						if (depth === 1) emit(pos + 1); // A string element just closed
+					}
+					continue;
+				}
+				if (depth === 0) {
+					if (ch === '[') depth = 1;
+					continue;
+				}
+				if (depth === 1 && itemStart === -1 && !/[\s,\]]/.test(ch)) itemStart = pos;
+				if (ch === '"') inString = true;
+				else if (ch === '[' || ch === '{') depth++;
+				else if (ch === ']' || ch === '}') {
+					depth--;
+					if (depth === 1) {
+						emit(pos + 1); // An object/array element just closed
+					} else if (depth === 0) {
+						if (itemStart !== -1) emit(pos);
+						finished = true;
+					}
+				} else if (ch === ',' && depth === 1 && itemStart !== -1) {
+					emit(pos);
+				}
+			}
+		},
+		// True once at least the opening '[' of an array was seen
+		get sawArray() { return depth > 0 || finished; },
+		get text() { return text; }
+	};
+};
+
+// Fallback for answers that are not a JSON array: one definition per non-empty line
+const splitLines = (text) => text.split(/\r?\n/).map(l => l.trim()).filter(Boolean);
+
+// --- Service ---
+
+// `db` needs get/run helpers; `backend` is one of the generators above.
+const createDefinitionsService = ({ db, backend, ttlSeconds }) => {
+	const inFlight = new Map(); // deckName -> { definitions, subscribers }
+
+	const readCache = async (deckName) => {
+		const row = await db.get(
+			`SELECT definitions, created_at FROM ai_definitions_cache WHERE deck_name = ? AND prompt_version = ?`,
+			[deckName, PROMPT_VERSION]
+		);
+		if (!row || row.created_at + ttlSeconds < Math.floor(Date.now() / 1000)) return null;
+		return JSON.parse(row.definitions);
+	};
+
+	const writeCache = (deckName, definitions) => db.run(
+		`INSERT OR REPLACE INTO ai_definitions_cache (deck_name, prompt_version, definitions, created_at)
+		VALUES (?, ?, ?, ?)`,
+		[deckName, PROMPT_VERSION, JSON.stringify(definitions), Math.floor(Date.now() / 1000)]
+	);
+
+	// Start one upstream generation and fan its results out to every subscriber
+	const startFlight = (deckName) => {
+		const flight = { definitions: [], subscribers: new Set() };
+		const publish = (definition) => {
+			flight.definitions.push(definition);
+			flight.subscribers.forEach(s => s.onDefinition(definition));
+		};
+		const finish = (error) => {
+			inFlight.delete(deckName);
+			flight.subscribers.forEach(s => (error ? s.onError(error) : s.onEnd()));
+			flight.subscribers.clear();
+		};
+
+		(async () => {
+			const parser = createArrayItemParser(publish);
+			for await (const chunk of backend(buildPrompt(deckName))) {
+				parser.push(chunk);
+			}
+			if (!parser.sawArray) {
+				splitLines(parser.text).forEach(publish);
+			}
+			if (flight.definitions.length > 0) {
+				await writeCache(deckName, flight.definitions);
+			}
+		})().then(() => finish(), finish);
+
+		inFlight.set(deckName, flight);
+		return flight;
+	};
+
+	return {
+		// Stream definitions for `deckName` to the callbacks; returns an unsubscribe function
+		async subscribe(deckName, { onDefinition, onEnd, onError }) {
+			const cached = await readCache(deckName);
+			if (cached) {
+				cached.forEach(onDefinition);
+				onEnd();
+				return () => { };
+			}
+
+			const flight = inFlight.get(deckName) || startFlight(deckName);
+			const subscriber = { onDefinition, onEnd, onError };
+			flight.definitions.forEach(onDefinition); // Replay what was already produced
+			flight.subscribers.add(subscriber);
+			return () => flight.subscribers.delete(subscriber);
+		}
+	};
+};
+
+module.exports = {
+	CACHE_TABLE,
+	PROMPT_VERSION,
+	geminiBackend,
+	stubBackend,
+	createArrayItemParser,
+	createDefinitionsService
+};
@@ -0,0 +1,34 @@
+// Helpers shared by the benchmark scripts.
+
+// Parse '--name value' pairs; values are converted to the type of the default
+const parseArgs = (argv, defaults) => {
+	const options = { ...defaults };
+	for (let i = 0; i < argv.length; i += 2) {
+		const name = argv[i].replace(/^--/, '');
+		if (!(name in defaults)) throw new Error(`Unknown option --${name}`);
+		const value = argv[i + 1];
+		options[name] = typeof defaults[name] === 'number' ? Number(value) : value;
+		if (typeof defaults[name] === 'number' && isNaN(options[name])) {
+			throw new Error(`--${name} expects a number`);
+		}
+	}
+	return options;
+};
+
+// Deterministic PRNG (mulberry32) returning floats in [0, 1)
+const createRandom = (seed) => {
+	let state = seed >>> 0;
+	return () => {
+		state = (state + 0x6D2B79F5) >>> 0;
+		let t = state;
+		t = Math.imul(t ^ (t >>> 15), t | 1);
+		t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+		return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+	};
+};
+
+// Nearest-rank percentile of an ascending array
+const percentile = (sorted, p) =>
+	sorted.length === 0 ? 0 : sorted[Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1)];
+
+module.exports = { parseArgs, createRandom, percentile };
@@ -0,0 +1,166 @@
+// Load test: starts the server against a copy of the benchmark database and drives the
+// deck list, due queue, rating and stats endpoints concurrently for a fixed time.
+// Usage: npm run bench -- [--concurrency 16] [--duration 15] [--warmup 3] [--json results.json]
+//
+// The database is seeded first if it does not exist (see seed.js; --cards/--decks/--reviews apply).
+// Every run starts from the same seeded copy, so numbers from different commits are comparable.
+const fs = require('fs');
+const path = require('path');
+const { spawn } = require('child_process');
+const { performance } = require('perf_hooks');
+const { seed, DEFAULTS: SEED_DEFAULTS } = require('./seed');
+const { parseArgs, createRandom, percentile } = require('./common');
+
+const DEFAULTS = {
+	...SEED_DEFAULTS,
+	port: 5055,
+	concurrency: 16,
+	duration: 15,      // Seconds measured
+	warmup: 3,         // Seconds run before measuring
+	json: ''           // Optional file for the results
+};
+
+// Relative weight of each scenario in the request mix
+const MIX = { decks: 2, due: 4, rate: 3, stats: 1 };
+const DUE_PAGE = 50;
+const MAX_POOL = 1000; // Due card ids remembered per deck for the rate scenario
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+async function startServer({ port }, dbFile) {
+	const server = spawn(process.execPath, [path.join(__dirname, '..', 'server.js')], {
+		env: { ...process.env, DB_FILE: dbFile, PORT: String(port), AI_BACKEND: 'stub', LOG_LEVEL: 'warn' },
+		stdio: ['ignore', 'inherit', 'inherit']
+	});
+	const exited = new Promise(resolve => server.once('exit', resolve));
+	const deadline = Date.now() + 30000;
+	while (Date.now() < deadline) {
+		try {
+			const response = await fetch(`http://localhost:${port}/api/decks`);
+			if (response.ok) return { server, exited };
+		} catch {
+			// Not listening yet
+		}
+		if (server.exitCode !== null) throw new Error(`Server exited with code ${server.exitCode}`);
+		await sleep(200);
+	}
+	server.kill();
+	throw new Error('Server did not become ready within 30s');
+}
+
+async function run(options) {
+	if (!fs.existsSync(options.db)) {
+		console.log(`${options.db} does not exist, seeding it first...`);
+		await seed(options);
+	}
+	const workFile = options.db.replace(/\.db$/, '') + '.run.db';
+	for (const suffix of ['', '-wal', '-shm']) {
+		fs.rmSync(workFile + suffix, { force: true });
+	}
+	fs.copyFileSync(options.db, workFile);
+
+	const baseUrl = `http://localhost:${options.port}`;
+	const { server, exited } = await startServer(options, workFile);
+	try {
+		const decks = (await (await fetch(`${baseUrl}/api/decks`)).json()).map(d => encodeURIComponent(d.name));
+		if (decks.length === 0) throw new Error('The benchmark database has no decks');
+		const pools = new Map(decks.map(deck => [deck, []]));
+		const random = createRandom(options.seed);
+		const pick = (items) => items[Math.floor(random() * items.length)];
+
+		// Each scenario resolves with { response, onBody? }. The worker reads the body exactly once
+		// (a fetch body cannot be consumed twice) and hands the bytes to onBody if it is set.
+		const scenarios = {
+			decks: async () => ({ response: await fetch(`${baseUrl}/api/decks`) }),
+			stats: async () => ({ response: await fetch(`${baseUrl}/api/stats`) }),
+			due: async () => {
+				const deck = pick(decks);
+				const response = await fetch(`${baseUrl}/api/decks/${deck}/cards/due?limit=${DUE_PAGE}`);
+				const onBody = (bytes) => {
+					if (!response.ok) return;
+					const pool = pools.get(deck);
+					for (const card of JSON.parse(Buffer.from(bytes).toString('utf8'))) {
+						if (pool.length < MAX_POOL) pool.push(card.id);
+					}
+				};
+				return { response, onBody };
+			},
+			rate: async () => {
+				const deck = decks.find(d => pools.get(d).length > 0);
+				if (!deck) return null; // Nothing fetched yet; the caller runs 'due' instead
+				const cardId = pools.get(deck).pop();
+				const response = await fetch(`${baseUrl}/api/decks/${deck}/cards/${cardId}/rate`, {
+					method: 'POST',
+					headers: { 'Content-Type': 'application/json' },
+					body: JSON.stringify({ quality: Math.floor(random() * 4), timeTakenMs: 1000 + Math.floor(random() * 9000) })
+				});
+				return { response };
+			}
+		};
+		const weighted = Object.entries(MIX).flatMap(([name, weight]) => Array(weight).fill(name));
+		const results = Object.fromEntries(Object.keys(MIX).map(name => [name, { latencies: [], errors: 0 }]));
+
+		const measureFrom = Date.now() + options.warmup * 1000;
+		const stopAt = measureFrom + options.duration * 1000;
+		const worker = async () => {
+			while (Date.now() < stopAt) {
+				let name = pick(weighted);
+				const started = performance.now();
+				let outcome = await scenarios[name]();
+				if (outcome === null) {
+					name = 'due';
+					outcome = await scenarios.due();
+				}
+				const { response, onBody } = outcome;
+				const body = await response.arrayBuffer(); // Include the body transfer in the latency
+				const elapsed = performance.now() - started;
+				if (onBody) onBody(body);
+				if (Date.now() < measureFrom) continue;
+				results[name].latencies.push(elapsed);
+				if (!response.ok) results[name].errors++;
+			}
+		};
+		console.log(`Running ${options.concurrency} clients for ${options.warmup}s warm-up + ${options.duration}s...`);
+		await Promise.all(Array.from({ length: options.concurrency }, worker));
+
+		const report = {};
+		for (const [name, { latencies, errors }] of Object.entries(results)) {
+			const sorted = latencies.sort((a, b) => a - b);
+			report[name] = {
+				requests: sorted.length,
+				errors,
+				rps: +(sorted.length / options.duration).toFixed(1),
+				p50: +percentile(sorted, 50).toFixed(2),
+				p95: +percentile(sorted, 95).toFixed(2),
+				p99: +percentile(sorted, 99).toFixed(2),
+				max: +(sorted[sorted.length - 1] || 0).toFixed(2)
+			};
+		}
+		console.log('\nLatency in ms:');
+		console.table(report);
+
+		// Server-side view of the same run
+		const metrics = await (await fetch(`${baseUrl}/metrics`)).text();
+		const interesting = metrics.split('\n').filter(line =>
+			line.startsWith('sqlite_slow_queries_total') || line.startsWith('nodejs_eventloop_lag'));
+		console.log(interesting.join('\n'));
+
+		if (options.json) {
+			fs.writeFileSync(options.json, JSON.stringify({ options, report }, null, 2));
+			console.log(`Results written to ${options.json}`);
+		}
+		return report;
+	} finally {
+		server.kill('SIGINT');
+		await exited;
+	}
+}
+
+if (require.main === module) {
+	run(parseArgs(process.argv.slice(2), DEFAULTS)).catch((err) => {
+		console.error('Benchmark failed:', err.message);
+		process.exitCode = 1;
+	});
+}
+
+module.exports = { run };
@@ -0,0 +1,108 @@
+// Create a synthetic database for benchmarking.
+// Usage: npm run bench:seed -- [--db bench/bench.db] [--decks 20] [--cards 50000] [--reviews 200000] [--seed 1]
+//
+// The data is deterministic for a given --seed, so runs against the same size are comparable.
+// Cards are spread over overdue, due-today and future dates, and reviews over the last 90 days.
+const fs = require('fs');
+const path = require('path');
+const { Database } = require('../db');
+const { initSchema } = require('../schema');
+const { parseArgs, createRandom } = require('./common');
+
+const DAY = 86400;
+const CHUNK_SIZE = 5000; // Rows per transaction
+
+async function seed({ db: file, decks, cards, reviews, seed }) {
+	const random = createRandom(seed);
+	for (const suffix of ['', '-wal', '-shm']) {
+		fs.rmSync(file + suffix, { force: true });
+	}
+
+	const db = await new Database(file).open();
+	try {
+		const mediaDir = path.join(path.dirname(file), 'bench_media');
+		await db.transaction(tx => initSchema(tx, { mediaDir }));
+
+		const deckIds = await db.transaction(async ({ run }) => {
+			const ids = [];
+			for (let i = 1; i <= decks; i++) {
+				ids.push((await run(`INSERT INTO decks (name) VALUES (?)`, [`Bench Deck ${i}`])).lastID);
+			}
+			return ids;
+		});
+
+		const now = Math.floor(Date.now() / 1000);
+		for (let start = 0; start < cards; start += CHUNK_SIZE) {
+			await db.transaction(async ({ run }) => {
+				for (let i = start; i < Math.min(start + CHUNK_SIZE, cards); i++) {
+					const interval = random() < 0.3 ? 1 : Math.ceil(random() * 180);
+					const due = now + Math.floor((random() * 90 - 30) * DAY); // 30 days overdue .. 60 days ahead
+					await run(
+						`INSERT INTO cards (deck_id, front_type, front_content, back_type, back_content, due_date, due, interval, ease_factor)
+						VALUES (?, 'text', ?, 'text', ?, ?, ?, ?, ?)`,
+						[
+							deckIds[i % deckIds.length],
+							`Question ${i + 1}`,
+							`Answer ${i + 1} `.repeat(1 + Math.floor(random() * 20)).trim(),
+							new Date(due * 1000).toISOString(),
+							due,
+							interval,
+							1.3 + random() * 1.7
+						]
+					);
+				}
+			});
+			process.stdout.write(`\rCards: ${Math.min(start + CHUNK_SIZE, cards)}/${cards}`);
+		}
+		process.stdout.write('\n');
+
+		for (let start = 0; start < reviews; start += CHUNK_SIZE) {
+			await db.transaction(async ({ run }) => {
+				for (let i = start; i < Math.min(start + CHUNK_SIZE, reviews); i++) {
+					const lastInterval = Math.ceil(random() * 60);
+					await run(
+						`INSERT INTO revlog (card_id, review_time, quality, last_interval, new_interval, new_ease_factor, time_taken)
+						VALUES (?, ?, ?, ?, ?, ?, ?)`,
+						[
+							1 + Math.floor(random() * cards),
+							new Date((now - Math.floor(random() * 90 * DAY)) * 1000).toISOString(),
+							Math.floor(random() * 4),
+							lastInterval,
+							lastInterval * (1 + random() * 1.5),
+							1.3 + random() * 1.7,
+							1000 + Math.floor(random() * 20000)
+						]
+					);
+				}
+			});
+			process.stdout.write(`\rReviews: ${Math.min(start + CHUNK_SIZE, reviews)}/${reviews}`);
+		}
+		process.stdout.write('\n');
+
+		await db.writer.exec('PRAGMA optimize; PRAGMA wal_checkpoint(TRUNCATE);');
+	} finally {
+		await db.close();
+	}
+}
+
+const DEFAULTS = {
+	db: path.join(__dirname, 'bench.db'),
+	decks: 20,
+	cards: 50000,
+	reviews: 200000,
+	seed: 1
+};
+
+if (require.main === module) {
+	const options = parseArgs(process.argv.slice(2), DEFAULTS);
+	console.log(`Seeding ${options.db}: ${options.decks} decks, ${options.cards} cards, ${options.reviews} reviews`);
+	const started = Date.now();
+	seed(options)
+		.then(() => console.log(`Done in ${((Date.now() - started) / 1000).toFixed(1)}s.`))
+		.catch((err) => {
+			console.error('Seeding failed:', err.message);
+			process.exitCode = 1;
+		});
+}
+
+module.exports = { seed, DEFAULTS };
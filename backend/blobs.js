@@ -0,0 +1,193 @@
+// Content-addressed, compressed storage for large card payloads (Excalidraw scenes).
+//
+// A payload is stored once in the 'blobs' table under the SHA-256 of its (minified) text,
+// pre-compressed with both brotli and gzip. Card rows only hold a 'blob:<hash>' reference,
+// and GET /api/blobs/:hash serves the compressed bytes directly. Triggers on cards keep a
+// reference count per blob, so garbage collection never has to scan the cards.
+
+const crypto = require('crypto');
+const util = require('util');
+const zlib = require('zlib');
+const { logger } = require('./logger');
+
+const brotliCompress = util.promisify(zlib.brotliCompress);
+const gzip = util.promisify(zlib.gzip);
+const gunzip = util.promisify(zlib.gunzip);
+
+const BLOB_REF_PREFIX = 'blob:';
+const BLOB_HASH_PATTERN = /^[0-9a-f]{64}$/;
+
+const BLOB_TABLE = `
+	CREATE TABLE IF NOT EXISTS blobs (
+		hash TEXT PRIMARY KEY,      -- SHA-256 (hex) of the uncompressed content
+		size INTEGER NOT NULL,      -- Uncompressed size in bytes
+		br BLOB NOT NULL,           -- Brotli-compressed content
+		gzip BLOB NOT NULL,         -- Gzip-compressed content
+		refs INTEGER NOT NULL DEFAULT 0  -- Card sides of type 'excalidraw' referencing this blob
+	) WITHOUT ROWID
+`;
+
+// Add `delta` to the reference count of the blob on one side of a card row
+const adjustRefs = (row, side, delta) => `
+	UPDATE blobs SET refs = refs + (${delta})
+	WHERE ${row}.${side}_type = 'excalidraw' AND hash = substr(${row}.${side}_content, ${BLOB_REF_PREFIX.length + 1});`;
+
+const BLOB_TRIGGERS = [
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_insert_blobs AFTER INSERT ON cards BEGIN
+		${adjustRefs('NEW', 'front', 1)}
+		${adjustRefs('NEW', 'back', 1)}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_delete_blobs AFTER DELETE ON cards BEGIN
+		${adjustRefs('OLD', 'front', -1)}
+		${adjustRefs('OLD', 'back', -1)}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_update_blobs
+	AFTER UPDATE OF front_type, front_content, back_type, back_content ON cards BEGIN
+		${adjustRefs('OLD', 'front', -1)}
+		${adjustRefs('OLD', 'back', -1)}
+		${adjustRefs('NEW', 'front', 1)}
+		${adjustRefs('NEW', 'back', 1)}
+	END`
+];
+
+const hashContent = (content) => crypto.createHash('sha256').update(content, 'utf8').digest('hex');
+
+// Returns the hash from a 'blob:<hash>' reference, or null if `content` is not a reference
+const parseBlobRef = (content) => {
+	if (typeof content !== 'string' || !content.startsWith(BLOB_REF_PREFIX)) return null;
+	const hash = content.slice(BLOB_REF_PREFIX.length);
+	return BLOB_HASH_PATTERN.test(hash) ? hash : null;
+};
+
+const toBlobRef = (hash) => BLOB_REF_PREFIX + hash;
+
+// Compress `text` into a blob row (no database access)
+async function encodeBlob(hash, text) {
+	const raw = Buffer.from(text, 'utf8');
+	const [br, gz] = await Promise.all([
+		brotliCompress(raw, { params: { [zlib.constants.BROTLI_PARAM_QUALITY]: 9 } }),
+		gzip(raw, { level: 9 })
+	]);
+	return { hash, size: raw.length, br, gzip: gz };
+}
+
+const insertBlob = (run, blob) => run(
+	`INSERT OR IGNORE INTO blobs (hash, size, br, gzip) VALUES (?, ?, ?, ?)`,
+	[blob.hash, blob.size, blob.br, blob.gzip]
+);
+
+// Read a blob back as text (used where the content is needed server-side)
+async function loadBlob(get, hash) {
+	const row = await get(`SELECT gzip FROM blobs WHERE hash = ?`, [hash]);
+	if (!row) return null;
+	return (await gunzip(row.gzip)).toString('utf8');
+}
+
+// First half of saving card content, done *before* the card's transaction: Excalidraw
+// scenes are minified, hashed and compressed here, so the writer is not held for it.
+// `get` is only used to skip compressing scenes that are already stored.
+// Resolves with { content, hash?, text?, blob? } for storeCardContent().
+async function encodeCardContent(get, type, content) {
+	if (type !== 'excalidraw') return { content };
+	const ref = parseBlobRef(content);
+	if (ref) return { content, hash: ref };
+	let minified = content;
+	try { minified = JSON.stringify(JSON.parse(content)); } catch (e) { /* ignore parse error, save as is */ }
+	const hash = hashContent(minified);
+	if (await get(`SELECT 1 FROM blobs WHERE hash = ?`, [hash])) {
+		return { content: toBlobRef(hash), hash, text: minified };
+	}
+	return { content: toBlobRef(hash), hash, blob: await encodeBlob(hash, minified) };
+}
+
+// Second half, inside the transaction that writes the card row: insert the encoded blob
+// (before the card, so its reference count starts at zero and the card's trigger counts it)
+// and return the content to store in the card. Throws on a reference to an unknown blob.
+async function storeCardContent(run, get, encoded) {
+	if (encoded.blob) {
+		await insertBlob(run, encoded.blob);
+	} else if (encoded.hash && !(await get(`SELECT 1 FROM blobs WHERE hash = ?`, [encoded.hash]))) {
+		// A stored scene collected since encodeCardContent() is re-encoded (rare)
+		if (encoded.text === undefined) throw new Error(`Unknown blob reference '${encoded.content}'`);
+		await insertBlob(run, await encodeBlob(encoded.hash, encoded.text));
+	}
+	return encoded.content;
+}
+
+// Both halves in one go, for callers that already hold the writer (schema migration)
+async function prepareCardContent(run, get, type, content) {
+	return storeCardContent(run, get, await encodeCardContent(get, type, content));
+}
+
+// Create the blob table and its reference-count triggers, move any inline Excalidraw
+// content of existing cards into it and recount the references
+async function initBlobs(run, get, all) {
+	await run(BLOB_TABLE);
+	const columns = await all(`PRAGMA table_info(blobs)`);
+	if (!columns.some(col => col.name === 'refs')) {
+		await run(`ALTER TABLE blobs ADD COLUMN refs INTEGER NOT NULL DEFAULT 0`);
+	}
+	for (const statement of BLOB_TRIGGERS) {
+		await run(statement);
+	}
+
+	for (const side of ['front', 'back']) {
+		const rows = await all(
+			`SELECT id FROM cards WHERE ${side}_type = 'excalidraw' AND ${side}_content NOT LIKE '${BLOB_REF_PREFIX}%'`
+		);
+		if (rows.length === 0) continue;
+		logger.info(`Moving ${rows.length} inline Excalidraw ${side} payloads to the blob store...`);
+		for (const { id } of rows) {
+			const card = await get(`SELECT ${side}_content AS content FROM cards WHERE id = ?`, [id]);
+			const ref = await prepareCardContent(run, get, 'excalidraw', card.content);
+			await run(`UPDATE cards SET ${side}_content = ? WHERE id = ?`, [ref, id]);
+		}
+	}
+
+	// One grouped pass over the cards, like the media recount
+	await run(`UPDATE blobs SET refs = 0`);
+	await run(`
+		UPDATE blobs SET refs = counted.refs FROM (
+			SELECT hash, SUM(n) AS refs FROM (
+				SELECT substr(front_content, ${BLOB_REF_PREFIX.length + 1}) AS hash, COUNT(*) AS n
+				FROM cards WHERE front_type = 'excalidraw' GROUP BY front_content
+				UNION ALL
+				SELECT substr(back_content, ${BLOB_REF_PREFIX.length + 1}), COUNT(*)
+				FROM cards WHERE back_type = 'excalidraw' GROUP BY back_content
+			) GROUP BY hash
+		) AS counted
+		WHERE counted.hash = blobs.hash
+	`);
+}
+
+// Hashes of the blobs a card row references (needs its *_type and *_content columns)
+const cardBlobHashes = (card) => ['front', 'back']
+	.filter(side => card[`${side}_type`] === 'excalidraw')
+	.map(side => parseBlobRef(card[`${side}_content`]))
+	.filter(Boolean);
+
+// Delete blobs that no card references any more (reference count zero). With `hashes`,
+// only those blobs are looked at (e.g. the drawings of a card that was just deleted or
+// edited); without, every blob is (startup and deck deletion).
+// Run this in the same transaction as the change that dropped the references, or after it;
+// blobs are written in the same transaction as the card that uses them, so a new blob is
+// never visible here without its card.
+async function collectBlobGarbage(run, hashes = null) {
+	if (hashes && hashes.length === 0) return 0;
+	const result = hashes
+		? await run(`DELETE FROM blobs WHERE hash IN (SELECT value FROM json_each(?)) AND refs <= 0`, [JSON.stringify(hashes)])
+		: await run(`DELETE FROM blobs WHERE refs <= 0`);
+	return result.changes;
+}
+
+module.exports = {
+	BLOB_HASH_PATTERN,
+	parseBlobRef,
+	loadBlob,
+	encodeCardContent,
+	storeCardContent,
+	prepareCardContent,
+	initBlobs,
+	cardBlobHashes,
+	collectBlobGarbage
+};
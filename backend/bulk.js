@@ -0,0 +1,482 @@
+// Streaming bulk import/export of cards.
+//
+// Formats:
+// - csv:  header row naming the columns (front/back required; deck, front_type, back_type,
+//         due_date, interval, ease_factor optional). Fields quoted as in RFC 4180.
+// - tsv:  Anki-style plain text: one note per line, front<TAB>back, with optional '#key:value'
+//         header lines ('#deck:', '#deck column:', '#notetype column:', '#tags column:', ...).
+//         Text only: content types are not stored, so decks with image or drawing cards
+//         cannot be exported as tsv (use csv or json).
+// - json: the legacy flashcards_data.json layout, { "decks": { "<name>": { "cards": [...] } } }.
+//
+// Input is parsed incrementally from a stream and inserted in chunked transactions, so memory
+// use does not depend on the file size. Exports read the deck in keyset-ordered chunks and
+// wait for the output to drain between chunks.
+
+const { encodeCardContent, storeCardContent, parseBlobRef, loadBlob } = require('./blobs');
+
+const FORMATS = {
+	csv: { contentType: 'text/csv; charset=utf-8', extension: '.csv' },
+	tsv: { contentType: 'text/tab-separated-values; charset=utf-8', extension: '.tsv' },
+	json: { contentType: 'application/json; charset=utf-8', extension: '.json' }
+};
+const CONTENT_TYPES = ['text', 'image', 'excalidraw'];
+const IMPORT_CHUNK_SIZE = 1000; // Cards per transaction
+const EXPORT_CHUNK_SIZE = 500;  // Cards read per query
+const MAX_REPORTED_ERRORS = 100;
+
+// Format for a Content-Type header or file name, or null
+const detectFormat = (hint = '') => {
+	const value = hint.toLowerCase();
+	if (value.includes('csv')) return 'csv';
+	if (value.includes('tab-separated') || value.endsWith('.tsv') || value.endsWith('.txt')) return 'tsv';
+	if (value.includes('json')) return 'json';
+	return null;
+};
+
+// Decode a byte/string stream to text chunks (drops a leading BOM)
+async function* textChunks(stream) {
+	const decoder = new TextDecoder();
+	for await (const chunk of stream) {
+		const text = typeof chunk === 'string' ? chunk : decoder.decode(chunk, { stream: true });
+		if (text) yield text;
+	}
+	const rest = decoder.decode();
+	if (rest) yield rest;
+}
+
+// --- Delimited text (CSV / TSV) ---
+
+// Incremental parser for delimiter-separated rows with RFC 4180 quoting.
+// Lines starting with `commentPrefix` before the first row (a header, as in Anki's '#key:value'
+// lines) are passed to onComment instead. After that such lines are ordinary rows.
+const createDelimitedParser = ({ delimiter, commentPrefix = null, onRow, onComment }) => {
+	let row = [];
+	let field = '';
+	let quoted = false;       // Inside a quoted field
+	let quotePending = false; // Saw '"' inside a quoted field: either an escape or the closing quote
+	let comment = null;       // Text of the comment line being read
+	let inHeader = true;      // No row yet, so comment lines are still recognized
+	let first = true;
+
+	const endRow = () => {
+		row.push(field);
+		field = '';
+		// Skip blank lines
+		if (row.length > 1 || row[0] !== '') {
+			inHeader = false;
+			onRow(row);
+		}
+		row = [];
+	};
+
+	const push = (chunk) => {
+		for (let i = 0; i < chunk.length; i++) {
+			const ch = chunk[i];
+			if (first) {
+				first = false;
+				if (ch === '\uFEFF') continue;
+			}
+			if (comment !== null) {
+				if (ch === '\n') {
+					onComment(comment.replace(/\r$/, ''));
+					comment = null;
+				} else {
+					comment += ch;
+				}
+				continue;
+			}
+			if (quoted) {
+				if (quotePending) {
+					quotePending = false;
+					if (ch === '"') {
+						field += '"';
+						continue;
+					}
+					quoted = false; // That was the closing quote; handle `ch` as unquoted below
+				} else {
+					if (ch === '"') quotePending = true;
+					else field += ch;
+					continue;
+				}
+			}
+			if (ch === '"' && field === '') {
+				quoted = true;
+			} else if (ch === delimiter) {
+				row.push(field);
+				field = '';
+			} else if (ch === '\n') {
+				endRow();
+			} else if (ch === commentPrefix && inHeader && row.length === 0 && field === '') {
+				comment = '';
+			} else if (ch !== '\r') {
+				field += ch;
+			}
+		}
+	};
+
+	const end = () => {
+		if (comment !== null) onComment(comment);
+		else if (row.length > 0 || field !== '' || quoted) endRow();
+	};
+
+	return { push, end };
+};
+
+// Yields { row } and { comment } items from a delimited text stream
+async function* parseDelimited(stream, options) {
+	const items = [];
+	const parser = createDelimitedParser({
+		...options,
+		onRow: row => items.push({ row }),
+		onComment: comment => items.push({ comment })
+	});
+	for await (const chunk of textChunks(stream)) {
+		parser.push(chunk);
+		yield* items.splice(0);
+	}
+	parser.end();
+	yield* items.splice(0);
+}
+
+// A leading '#' is quoted too, so a first field like '#1' is not taken for a header line
+const quoteField = (value, delimiter) => {
+	const text = value === null || value === undefined ? '' : String(value);
+	return /^#|["\r\n]/.test(text) || text.includes(delimiter) ? `"${text.replace(/"/g, '""')}"` : text;
+};
+
+const formatRow = (fields, delimiter) => fields.map(f => quoteField(f, delimiter)).join(delimiter);
+
+// --- Legacy JSON ---
+
+// Yields { deck, card } for every element of decks.<name>.cards in a legacy data file,
+// keeping only the card being read in memory.
+async function* parseLegacyJson(stream) {
+	const stack = [];     // Open containers: { type: 'object' | 'array', key, expectingKey }
+	let text = '';
+	let pos = 0;
+	let inString = false;
+	let escaped = false;
+	let stringStart = -1;
+	let captureStart = -1; // Start of the card object being read
+	let captureDeck = null;
+	const cards = [];
+
+	// True when a value opening now is an element of decks.<name>.cards
+	const atCardElement = () => stack.length === 4 &&
+		stack[0].type === 'object' && stack[0].key === 'decks' &&
+		stack[1].type === 'object' &&
+		stack[2].type === 'object' && stack[2].key === 'cards' &&
+		stack[3].type === 'array';
+
+	for await (const chunk of textChunks(stream)) {
+		text += chunk;
+		for (; pos < text.length; pos++) {
+			const ch = text[pos];
+			if (inString) {
+				if (escaped) escaped = false;
+				else if (ch === '\\') escaped = true;
+				else if (ch === '"') {
+					inString = false;
+					const top = stack[stack.length - 1];
+					if (top && top.type === 'object' && top.expectingKey) {
+						top.key = JSON.parse(text.slice(stringStart, pos + 1));
+						top.expectingKey = false;
+					}
+				}
+				continue;
+			}
+			if (stack.length === 0 && !/\s/.test(ch) && ch !== '{') {
+				throw new Error("Expected a JSON object with a 'decks' property");
+			}
+			if (ch === '"') {
+				inString = true;
+				stringStart = pos;
+			} else if (ch === '{' || ch === '[') {
+				if (captureStart === -1 && ch === '{' && atCardElement()) {
+					captureStart = pos;
+					captureDeck = stack[1].key;
+				}
+				stack.push({ type: ch === '{' ? 'object' : 'array', key: null, expectingKey: ch === '{' });
+			} else if (ch === '}' || ch === ']') {
+				stack.pop();
+				if (captureStart !== -1 && stack.length === 4) {
+					cards.push({ deck: captureDeck, card: JSON.parse(text.slice(captureStart, pos + 1)) });
+					captureStart = -1;
+				}
+			} else if (ch === ',') {
+				const top = stack[stack.length - 1];
+				if (top && top.type === 'object') top.expectingKey = true;
+			}
+		}
+		// Drop text that is no longer needed (keep the card or key string being read)
+		const keep = captureStart !== -1 ? captureStart : (inString ? stringStart : pos);
+		text = text.slice(keep);
+		pos -= keep;
+		if (captureStart !== -1) captureStart -= keep;
+		if (inString) stringStart -= keep;
+
+		yield* cards.splice(0);
+	}
+	if (stack.length > 0 || inString) {
+		throw new Error('Unexpected end of JSON input');
+	}
+}
+
+// --- Import ---
+
+// Validate one imported card and fill in scheduling defaults; throws on invalid input
+const normalizeCard = (raw) => {
+	const front_type = raw.front_type || 'text';
+	const back_type = raw.back_type || 'text';
+	if (!CONTENT_TYPES.includes(front_type) || !CONTENT_TYPES.includes(back_type)) {
+		throw new Error(`Invalid content type '${CONTENT_TYPES.includes(front_type) ? back_type : front_type}'`);
+	}
+	const front_content = raw.front_content ?? raw.front;
+	const back_content = raw.back_content ?? raw.back;
+	if (front_content === undefined || front_content === null || front_content === '' ||
+		back_content === undefined || back_content === null || back_content === '') {
+		throw new Error('Missing card content');
+	}
+
+	const parsedDue = Date.parse(raw.due_date);
+	const due = isNaN(parsedDue) ? Math.floor(Date.now() / 1000) : Math.floor(parsedDue / 1000);
+	const interval = Number(raw.interval);
+	const easeFactor = Number(raw.ease_factor);
+	return {
+		front_type,
+		front_content: typeof front_content === 'string' ? front_content : JSON.stringify(front_content),
+		back_type,
+		back_content: typeof back_content === 'string' ? back_content : JSON.stringify(back_content),
+		due_date: isNaN(parsedDue) ? new Date(due * 1000).toISOString() : raw.due_date,
+		due,
+		interval: interval > 0 ? interval : 1.0,
+		ease_factor: easeFactor >= 1.3 ? easeFactor : 2.5
+	};
+};
+
+// CSV rows -> records. Columns are matched by header name.
+async function* readCsv(stream, { deck }) {
+	let columns = null;
+	let line = 1;
+	for await (const { row } of parseDelimited(stream, { delimiter: ',' })) {
+		if (!columns) {
+			columns = row.map(name => name.trim().toLowerCase());
+			if (!columns.some(c => c === 'front' || c === 'front_content') ||
+				!columns.some(c => c === 'back' || c === 'back_content')) {
+				throw new Error("CSV header must name 'front' and 'back' columns");
+			}
+			continue;
+		}
+		line++;
+		const raw = {};
+		columns.forEach((name, i) => { if (row[i] !== undefined && row[i] !== '') raw[name] = row[i]; });
+		yield { line, deck: raw.deck || deck, raw };
+	}
+}
+
+// Anki plain-text notes -> records
+async function* readTsv(stream, { deck }) {
+	let deckName = deck;
+	let deckColumn = -1;
+	const skipColumns = new Set(); // Deck, notetype, tags and guid columns (0-based)
+	let line = 0;
+	for await (const item of parseDelimited(stream, { delimiter: '\t', commentPrefix: '#' })) {
+		line++;
+		if (item.comment !== undefined) {
+			const match = item.comment.match(/^([a-z ]+):(.*)$/i);
+			if (!match) continue;
+			const key = match[1].trim().toLowerCase();
+			const value = match[2].trim();
+			if (key === 'separator' && value.toLowerCase() !== 'tab' && value !== '\t') {
+				throw new Error(`Unsupported separator '${value}' (only tab-separated files are supported)`);
+			} else if (key === 'deck') {
+				deckName = value;
+			} else if (/^(deck|notetype|tags|guid) column$/.test(key)) {
+				const column = parseInt(value, 10) - 1;
+				skipColumns.add(column);
+				if (key === 'deck column') deckColumn = column;
+			}
+			continue;
+		}
+		const fields = item.row.filter((_, i) => !skipColumns.has(i));
+		yield {
+			line,
+			deck: (deckColumn !== -1 && item.row[deckColumn]) || deckName,
+			raw: { front: fields[0], back: fields[1] }
+		};
+	}
+}
+
+async function* readJson(stream) {
+	let line = 0;
+	for await (const { deck, card } of parseLegacyJson(stream)) {
+		line++; // Card number in the file
+		yield { line, deck, raw: card };
+	}
+}
+
+const READERS = { csv: readCsv, tsv: readTsv, json: readJson };
+
+// Import cards from `stream` in `format`. Cards without a deck go to `deck`; missing decks are created.
+// `onProgress({ imported, skipped })` is called after every committed chunk.
+// Resolves with { imported, skipped, decks, errors }.
+async function importCards(db, stream, { format, deck = 'Default', chunkSize = IMPORT_CHUNK_SIZE, onProgress = () => { } }) {
+	const read = READERS[format];
+	if (!read) throw new Error(`Unsupported format '${format}'`);
+
+	const deckIds = new Map();
+	const errors = [];
+	let imported = 0;
+	let skipped = 0;
+
+	const skip = (line, err) => {
+		skipped++;
+		if (errors.length < MAX_REPORTED_ERRORS) errors.push({ line, error: err.message });
+	};
+
+	// Resolves with the number of cards inserted
+	const insertChunk = (chunk) => db.transaction(async ({ run, get }) => {
+		let inserted = 0;
+		for (const { line, deck: deckName, card, front, back } of chunk) {
+			let frontContent, backContent;
+			try {
+				// An unknown blob reference skips this card, not the whole chunk
+				frontContent = await storeCardContent(run, get, front);
+				backContent = await storeCardContent(run, get, back);
+			} catch (err) {
+				skip(line, err);
+				continue;
+			}
+			let deckId = deckIds.get(deckName);
+			if (deckId === undefined) {
+				await run(`INSERT OR IGNORE INTO decks (name) VALUES (?)`, [deckName]);
+				deckId = (await get(`SELECT id FROM decks WHERE name = ?`, [deckName])).id;
+				deckIds.set(deckName, deckId);
+			}
+			await run(
+				`INSERT INTO cards (deck_id, front_type, front_content, back_type, back_content, due_date, due, interval, ease_factor)
+				VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)`,
+				[
+					deckId,
+					card.front_type, frontContent,
+					card.back_type, backContent,
+					card.due_date, card.due, card.interval, card.ease_factor
+				]
+			);
+			inserted++;
+		}
+		return inserted;
+	});
+
+	let chunk = [];
+	for await (const { line, deck: deckName, raw } of read(stream, { deck })) {
+		try {
+			const name = typeof deckName === 'string' ? deckName.trim() : '';
+			if (!name) throw new Error('Missing deck name');
+			const card = normalizeCard(raw);
+			// Drawings are compressed here, outside the chunk's transaction
+			chunk.push({
+				line,
+				deck: name,
+				card,
+				front: await encodeCardContent(db.get, card.front_type, card.front_content),
+				back: await encodeCardContent(db.get, card.back_type, card.back_content)
+			});
+		} catch (err) {
+			skip(line, err);
+			continue;
+		}
+		if (chunk.length >= chunkSize) {
+			imported += await insertChunk(chunk);
+			chunk = [];
+			onProgress({ imported, skipped });
+		}
+	}
+	if (chunk.length > 0) {
+		imported += await insertChunk(chunk);
+	}
+	onProgress({ imported, skipped });
+	return { imported, skipped, decks: [...deckIds.keys()], errors };
+}
+
+// --- Export ---
+
+const EXPORT_COLUMNS = ['front_type', 'front_content', 'back_type', 'back_content', 'due_date', 'interval', 'ease_factor'];
+
+const WRITERS = {
+	csv: {
+		header: () => formatRow(['deck', ...EXPORT_COLUMNS], ',') + '\r\n',
+		row: (card, deckName) => formatRow([deckName, ...EXPORT_COLUMNS.map(c => card[c])], ',') + '\r\n',
+		footer: () => ''
+	},
+	tsv: {
+		textOnly: true,
+		header: (deckName) => `#separator:tab\n#html:false\n#deck:${deckName}\n#columns:Front\tBack\n`,
+		row: (card) => formatRow([card.front_content, card.back_content], '\t') + '\n',
+		footer: () => ''
+	},
+	json: {
+		header: (deckName) => `{"decks":{${JSON.stringify(deckName)}:{"cards":[`,
+		row: (card, deckName, index) => (index === 0 ? '\n' : ',\n') + JSON.stringify(card),
+		footer: () => '\n]}}}\n'
+	}
+};
+
+// Write all cards of `deckName` in `format` through `write(text)` (which may return a promise,
+// e.g. to wait for a stream to drain). Drawings are inlined so the export is self-contained.
+// Resolves with the number of cards, or null if the deck does not exist. Rejects with
+// code 'UNSUPPORTED_CONTENT', before writing anything, if the format cannot hold the deck's cards.
+async function exportDeck(db, deckName, format, write) {
+	const writer = WRITERS[format];
+	if (!writer) throw new Error(`Unsupported format '${format}'`);
+	const deck = await db.get(`SELECT id FROM decks WHERE name = ?`, [deckName]);
+	if (!deck) return null;
+	if (writer.textOnly) {
+		const nonText = await db.get(
+			`SELECT 1 FROM cards WHERE deck_id = ? AND (front_type <> 'text' OR back_type <> 'text') LIMIT 1`,
+			[deck.id]
+		);
+		if (nonText) {
+			throw Object.assign(
+				new Error(`Deck '${deckName}' has image or drawing cards, which ${format} cannot store; use csv or json`),
+				{ code: 'UNSUPPORTED_CONTENT' }
+			);
+		}
+	}
+
+	await write(writer.header(deckName));
+	let cursor = -1;
+	let count = 0;
+	for (; ;) {
+		const cards = await db.all(
+			`SELECT id, ${EXPORT_COLUMNS.join(', ')} FROM cards WHERE deck_id = ? AND id > ? ORDER BY id LIMIT ?`,
+			[deck.id, cursor, EXPORT_CHUNK_SIZE]
+		);
+		let text = '';
+		for (const card of cards) {
+			for (const side of ['front', 'back']) {
+				const hash = parseBlobRef(card[`${side}_content`]);
+				if (card[`${side}_type`] === 'excalidraw' && hash) {
+					card[`${side}_content`] = await loadBlob(db.get, hash);
+				}
+			}
+			cursor = card.id;
+			delete card.id;
+			text += writer.row(card, deckName, count++);
+		}
+		if (text) await write(text);
+		if (cards.length < EXPORT_CHUNK_SIZE) break;
+	}
+	await write(writer.footer());
+	return count;
+}
+
+module.exports = {
+	FORMATS,
+	detectFormat,
+	createDelimitedParser,
+	parseLegacyJson,
+	importCards,
+	exportDeck
+};
@@ -0,0 +1,245 @@
+// SQLite data-access layer.
+//
+// - One writer connection and a small pool of read-only connections. In WAL mode readers
+//   never block on the writer, so deck lists and stats keep flowing while ratings are saved.
+// - Every connection keeps an LRU cache of prepared statements, so hot queries are compiled once.
+// - Writes are queued: a plain `run` and a whole `transaction` each get the writer to themselves,
+//   so statements from concurrent requests can never end up inside someone else's transaction.
+// - An optional `onQuery(sql, durationMs)` hook is called after every statement (see metrics.js).
+
+const os = require('os');
+const sqlite3 = require('sqlite3');
+
+// Schema changes run once and invalidate prepared statements anyway, so they are not cached
+const DDL_PATTERN = /^\s*(CREATE|DROP|ALTER)\b/i;
+
+const DEFAULT_OPTIONS = {
+	readers: Math.min(4, Math.max(1, os.cpus().length)), // Read-only connections in the pool
+	statementCacheSize: 100,                              // Prepared statements kept per connection
+	busyTimeoutMs: 5000,                                  // How long to wait on a locked database
+	onQuery: null                                         // (sql, durationMs) => void, for instrumentation
+};
+
+const openConnection = (filename, mode) => new Promise((resolve, reject) => {
+	const connection = new sqlite3.Database(filename, mode, (err) => {
+		if (err) reject(err);
+		else resolve(connection);
+	});
+});
+
+const exec = (connection, sql) => new Promise((resolve, reject) => {
+	connection.exec(sql, (err) => {
+		if (err) reject(err);
+		else resolve();
+	});
+});
+
+// A connection plus its prepared-statement cache
+class Connection {
+	constructor(connection, cacheSize, onQuery) {
+		this.connection = connection;
+		this.cacheSize = cacheSize;
+		this.onQuery = onQuery;
+		this.statements = new Map(); // SQL -> Statement, oldest first
+		this.pending = 0;            // Queries in flight, used to pick the least busy reader
+	}
+
+	statement(sql) {
+		let statement = this.statements.get(sql);
+		if (statement) {
+			// Move to the most recently used end
+			this.statements.delete(sql);
+		} else {
+			statement = this.connection.prepare(sql);
+			if (this.statements.size >= this.cacheSize) {
+				const [oldestSql, oldest] = this.statements.entries().next().value;
+				this.statements.delete(oldestSql);
+				oldest.finalize();
+			}
+		}
+		this.statements.set(sql, statement);
+		return statement;
+	}
+
+	track(sql, promise) {
+		this.pending++;
+		const start = this.onQuery ? process.hrtime.bigint() : 0n;
+		return promise.finally(() => {
+			this.pending--;
+			if (this.onQuery) this.onQuery(sql, Number(process.hrtime.bigint() - start) / 1e6);
+		});
+	}
+
+	all(sql, params = []) {
+		return this.track(sql, new Promise((resolve, reject) => {
+			this.statement(sql).all(params, (err, rows) => {
+				if (err) reject(err);
+				else resolve(rows);
+			});
+		}));
+	}
+
+	get(sql, params = []) {
+		return this.track(sql, new Promise((resolve, reject) => {
+			const statement = this.statement(sql);
+			statement.get(params, (err, row) => {
+				if (err) reject(err);
+				else resolve(row);
+			});
+			// A stepped statement keeps its read transaction open until reset
+			statement.reset();
+		}));
+	}
+
+	run(sql, params = []) {
+		return this.track(sql, new Promise((resolve, reject) => {
+			const callback = function (err) { // Use function() to access this.lastID/changes
+				if (err) reject(err);
+				else resolve({ lastID: this.lastID, changes: this.changes });
+			};
+			if (DDL_PATTERN.test(sql)) {
+				this.connection.run(sql, params, callback);
+			} else {
+				this.statement(sql).run(params, callback);
+			}
+		}));
+	}
+
+	// Stream rows one at a time; resolves with the row count
+	each(sql, params = [], onRow) {
+		return this.track(sql, new Promise((resolve, reject) => {
+			this.statement(sql).each(params, (err, row) => {
+				if (!err) onRow(row);
+			}, (err, count) => {
+				if (err) reject(err);
+				else resolve(count);
+			});
+		}));
+	}
+
+	// Multi-statement SQL (BEGIN/COMMIT, pragmas); never cached
+	exec(sql) {
+		return exec(this.connection, sql);
+	}
+
+	close() {
+		for (const statement of this.statements.values()) {
+			statement.finalize();
+		}
+		this.statements.clear();
+		return new Promise((resolve, reject) => {
+			this.connection.close((err) => {
+				if (err) reject(err);
+				else resolve();
+			});
+		});
+	}
+}
+
+class Database {
+	constructor(filename, options = {}) {
+		this.filename = filename;
+		this.options = { ...DEFAULT_OPTIONS, ...options };
+		this.writer = null;
+		this.readers = [];
+		// Queries issued before open() has finished wait in the write queue behind this
+		this.opened = new Promise((resolve, reject) => {
+			this.settleOpen = { resolve, reject };
+		});
+		this.opened.catch(() => { }); // A failed open is reported by open() and the queued queries
+		this.writeQueue = this.opened;
+	}
+
+	// Open the writer connection and switch the database to WAL mode.
+	// Readers are opened separately (openReaders) once the schema exists.
+	async open() {
+		try {
+			const connection = await openConnection(
+				this.filename,
+				sqlite3.OPEN_READWRITE | sqlite3.OPEN_CREATE
+			);
+			await exec(connection, `
+				PRAGMA journal_mode = WAL;
+				PRAGMA synchronous = NORMAL;
+				PRAGMA busy_timeout = ${this.options.busyTimeoutMs};
+				PRAGMA foreign_keys = ON;
+			`);
+			this.writer = new Connection(connection, this.options.statementCacheSize, this.options.onQuery);
+		} catch (err) {
+			this.settleOpen.reject(err);
+			throw err;
+		}
+		this.settleOpen.resolve();
+		return this;
+	}
+
+	async openReaders() {
+		for (let i = this.readers.length; i < this.options.readers; i++) {
+			const connection = await openConnection(this.filename, sqlite3.OPEN_READONLY);
+			await exec(connection, `PRAGMA busy_timeout = ${this.options.busyTimeoutMs};`);
+			this.readers.push(new Connection(connection, this.options.statementCacheSize, this.options.onQuery));
+		}
+	}
+
+	// Least busy read-only connection
+	reader() {
+		return this.readers.reduce((best, reader) => (reader.pending < best.pending ? reader : best));
+	}
+
+	// Run `work` with exclusive use of the writer connection
+	withWriter(work) {
+		const result = this.writeQueue.then(() => work(this.writer));
+		this.writeQueue = result.catch(() => { });
+		return result;
+	}
+
+	// --- Query helpers (same shape as the old ad-hoc helpers in server.js) ---
+
+	// Reads use the pool once it is open. Until then (startup, schema setup, scripts that never
+	// open readers) they are queued on the writer, so they neither run before open() nor
+	// inside someone else's transaction.
+	read(work) {
+		return this.readers.length > 0 ? work(this.reader()) : this.withWriter(work);
+	}
+
+	all = (sql, params = []) => this.read(connection => connection.all(sql, params));
+
+	get = (sql, params = []) => this.read(connection => connection.get(sql, params));
+
+	each = (sql, params = [], onRow) => this.read(connection => connection.each(sql, params, onRow));
+
+	run = (sql, params = []) => this.withWriter(writer => writer.run(sql, params));
+
+	// Run `work(tx)` inside one transaction on the writer; commits if it resolves, rolls back if it throws.
+	// `tx` has the same all/get/run/each/exec helpers, all bound to the writer.
+	transaction = (work) => this.withWriter(async (writer) => {
+		const tx = {
+			all: (sql, params) => writer.all(sql, params),
+			get: (sql, params) => writer.get(sql, params),
+			run: (sql, params) => writer.run(sql, params),
+			each: (sql, params, onRow) => writer.each(sql, params, onRow),
+			exec: (sql) => writer.exec(sql)
+		};
+		await writer.exec('BEGIN IMMEDIATE');
+		try {
+			const value = await work(tx);
+			await writer.exec('COMMIT');
+			return value;
+		} catch (err) {
+			await writer.exec('ROLLBACK').catch(() => { });
+			throw err;
+		}
+	});
+
+	async close() {
+		await this.writeQueue.catch(() => { });
+		await Promise.all(this.readers.map(reader => reader.close()));
+		this.readers = [];
+		if (this.writer) {
+			await this.writer.close();
+			this.writer = null;
+		}
+	}
+}
+
+module.exports = { Database };
@@ -0,0 +1,80 @@
+// Small asynchronous logger used instead of console.* on request paths.
+//
+// - Levels: error < warn < info < debug. LOG_LEVEL (default 'info') sets the most verbose level written.
+// - Per-request chatter is logged at 'debug'; LOG_SAMPLE_RATE (0..1, default 1) keeps only that
+//   fraction of debug lines, so request logging can stay on under load.
+// - Lines are buffered and written in one batch per event-loop turn instead of one synchronous
+//   write per call. If the buffer grows past MAX_BUFFERED_LINES (slow terminal/pipe), new lines
+//   are dropped and the number dropped is reported once writing catches up.
+
+const util = require('util');
+
+const LEVELS = { error: 0, warn: 1, info: 2, debug: 3 };
+const MAX_BUFFERED_LINES = 10000;
+
+function createLogger({
+	level = 'info',
+	sampleRate = 1,
+	out = process.stdout,  // info/debug
+	err = process.stderr   // warn/error
+} = {}) {
+	const threshold = LEVELS[level] ?? LEVELS.info;
+	const buffers = new Map([[out, []], [err, []]]);
+	let buffered = 0;
+	let dropped = 0;
+	let scheduled = false;
+
+	const flush = () => {
+		scheduled = false;
+		for (const [stream, lines] of buffers) {
+			if (lines.length === 0) continue;
+			stream.write(lines.join(''));
+			lines.length = 0;
+		}
+		buffered = 0;
+		if (dropped > 0) {
+			const count = dropped;
+			dropped = 0;
+			write('warn', [`Logger dropped ${count} lines (output too slow)`]);
+		}
+	};
+
+	const write = (name, args) => {
+		if (buffered >= MAX_BUFFERED_LINES) {
+			dropped++;
+			return;
+		}
+		const line = `${new Date().toISOString()} ${name.toUpperCase()} ${util.format(...args)}\n`;
+		buffers.get(LEVELS[name] <= LEVELS.warn ? err : out).push(line);
+		buffered++;
+		if (!scheduled) {
+			scheduled = true;
+			setImmediate(flush);
+		}
+	};
+
+	const logger = {
+		// True if messages at `name` are written at all (use to skip building expensive messages)
+		enabled: (name) => LEVELS[name] <= threshold,
+		flush
+	};
+	for (const name of Object.keys(LEVELS)) {
+		logger[name] = (...args) => {
+			if (LEVELS[name] > threshold) return;
+			if (name === 'debug' && sampleRate < 1 && Math.random() >= sampleRate) return;
+			write(name, args);
+		};
+	}
+	return logger;
+}
+
+const sampleRate = parseFloat(process.env.LOG_SAMPLE_RATE);
+const logger = createLogger({
+	level: process.env.LOG_LEVEL,
+	sampleRate: isNaN(sampleRate) ? 1 : sampleRate
+});
+
+// Write whatever is still buffered before the process goes away
+process.on('exit', () => logger.flush());
+
+module.exports = { LEVELS, createLogger, logger };
@@ -0,0 +1,318 @@
+// Media pipeline for uploaded images.
+//
+// - Only raster images are accepted (IMAGE_EXTENSIONS). They are streamed to disk while
+//   being hashed and stored as '<sha256><ext>', with the extension taken from the image type,
+//   so uploading the same file twice keeps a single copy.
+// - Resized variants ('<name>.thumb.webp', '<name>.display.webp') are rendered by a small
+//   worker-thread pool after the upload has been answered. This uses the 'sharp' package,
+//   an optionalDependency: npm skips it where its native build is unavailable, and then
+//   only originals are served (the /media/thumb and /media/display routes fall back to them).
+// - The 'media' table counts how many card sides reference each file. Triggers keep the
+//   count current, and collectMediaGarbage() deletes files nobody references any more.
+
+const crypto = require('crypto');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const { Worker } = require('worker_threads');
+const { logger } = require('./logger');
+
+const HASHED_NAME_PATTERN = /^[0-9a-f]{64}(\.[a-z0-9]{1,8})?$/;
+const VARIANTS = {
+	thumb: 200,    // Card Browser previews
+	display: 1280  // Study session
+};
+// Accepted upload types and the extension each is stored (and later served) under.
+// Raster images only: an uploaded HTML or SVG file would run script when opened from /media.
+const IMAGE_EXTENSIONS = {
+	'image/jpeg': '.jpg',
+	'image/png': '.png',
+	'image/webp': '.webp',
+	'image/gif': '.gif',
+	'image/avif': '.avif',
+	'image/tiff': '.tiff'
+};
+const RESIZABLE_TYPES = Object.keys(IMAGE_EXTENSIONS);
+// Uploads are kept this long before a card has to reference them
+const GC_GRACE_SECONDS = 60 * 60;
+
+const MEDIA_TABLE = `
+	CREATE TABLE IF NOT EXISTS media (
+		filename TEXT PRIMARY KEY,
+		size INTEGER NOT NULL,
+		created_at INTEGER NOT NULL,     -- Unix epoch seconds
+		refs INTEGER NOT NULL DEFAULT 0  -- Card sides with type 'image' showing this file
+	) WITHOUT ROWID
+`;
+
+// Add `delta` to the reference count of the image on one side of a card row
+const adjustRefs = (row, side, delta) => `
+	UPDATE media SET refs = refs + (${delta})
+	WHERE ${row}.${side}_type = 'image' AND filename = ${row}.${side}_content;`;
+
+const MEDIA_TRIGGERS = [
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_insert_media AFTER INSERT ON cards BEGIN
+		${adjustRefs('NEW', 'front', 1)}
+		${adjustRefs('NEW', 'back', 1)}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_delete_media AFTER DELETE ON cards BEGIN
+		${adjustRefs('OLD', 'front', -1)}
+		${adjustRefs('OLD', 'back', -1)}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_update_media
+	AFTER UPDATE OF front_type, front_content, back_type, back_content ON cards BEGIN
+		${adjustRefs('OLD', 'front', -1)}
+		${adjustRefs('OLD', 'back', -1)}
+		${adjustRefs('NEW', 'front', 1)}
+		${adjustRefs('NEW', 'back', 1)}
+	END`
+];
+
+const variantName = (filename, variant) => `${filename}.${variant}.webp`;
+
+const nowEpoch = () => Math.floor(Date.now() / 1000);
+
+// Create the table and triggers, register files already in `mediaDir`
+// (including pre-hashing uploads) and recount references from the cards.
+async function initMedia(run, mediaDir) {
+	await fs.promises.mkdir(mediaDir, { recursive: true });
+	await run(MEDIA_TABLE);
+	for (const statement of MEDIA_TRIGGERS) {
+		await run(statement);
+	}
+
+	const files = await fs.promises.readdir(mediaDir);
+	const variantSuffixes = Object.keys(VARIANTS).map(v => `.${v}.webp`);
+	for (const filename of files) {
+		if (filename.endsWith('.tmp') || variantSuffixes.some(suffix => filename.endsWith(suffix))) continue;
+		const stat = await fs.promises.stat(path.join(mediaDir, filename));
+		if (!stat.isFile()) continue;
+		await run(
+			`INSERT OR IGNORE INTO media (filename, size, created_at) VALUES (?, ?, ?)`,
+			[filename, stat.size, Math.floor(stat.mtimeMs / 1000)]
+		);
+	}
+	// One grouped pass over the cards instead of two correlated counts per file
+	await run(`UPDATE media SET refs = 0`);
+	await run(`
+		UPDATE media SET refs = counted.refs FROM (
+			SELECT filename, SUM(n) AS refs FROM (
+				SELECT front_content AS filename, COUNT(*) AS n FROM cards WHERE front_type = 'image' GROUP BY front_content
+				UNION ALL
+				SELECT back_content, COUNT(*) FROM cards WHERE back_type = 'image' GROUP BY back_content
+			) GROUP BY filename
+		) AS counted
+		WHERE counted.filename = media.filename
+	`);
+}
+
+// Record an upload so it is tracked for garbage collection
+async function registerUpload(run, file) {
+	// Re-uploading a known file restarts its grace period
+	await run(
+		`INSERT INTO media (filename, size, created_at) VALUES (?, ?, ?)
+		ON CONFLICT (filename) DO UPDATE SET created_at = excluded.created_at`,
+		[file.filename, file.size, nowEpoch()]
+	);
+}
+
+// Multer fileFilter: skips files that are not one of the accepted image types.
+// The reason is left in req.fileValidationError for the route to answer with.
+const imageFileFilter = (req, file, cb) => {
+	if (IMAGE_EXTENSIONS[file.mimetype]) return cb(null, true);
+	req.fileValidationError = `Unsupported file type '${file.mimetype}'. Allowed: ${RESIZABLE_TYPES.join(', ')}`;
+	cb(null, false);
+};
+
+// Multer storage engine: streams the upload to a temp file while hashing it,
+// then renames it to '<sha256><ext>' (or drops it if that file already exists).
+// `db` is the Database; the upload is registered in the same write transaction
+// that decides whether it is a duplicate, so collectMediaGarbage() cannot delete
+// an existing copy between the check and the registration.
+const createHashingStorage = (db, mediaDir) => ({
+	_handleFile(req, file, cb) {
+		// The extension follows the checked type (see imageFileFilter), not the client's file name
+		const ext = IMAGE_EXTENSIONS[file.mimetype];
+		const tmpPath = path.join(mediaDir, `${crypto.randomUUID()}.tmp`);
+		const hash = crypto.createHash('sha256');
+		let size = 0;
+
+		const out = fs.createWriteStream(tmpPath);
+		file.stream.on('data', (chunk) => {
+			hash.update(chunk);
+			size += chunk.length;
+		});
+		file.stream.on('error', (err) => out.destroy(err));
+		out.on('error', (err) => {
+			fs.promises.unlink(tmpPath).catch(() => { });
+			cb(err);
+		});
+		out.on('finish', async () => {
+			const filename = hash.digest('hex') + ext;
+			const finalPath = path.join(mediaDir, filename);
+			try {
+				const duplicate = await db.transaction(async ({ run }) => {
+					await registerUpload(run, { filename, size });
+					try {
+						await fs.promises.access(finalPath);
+					} catch {
+						await fs.promises.rename(tmpPath, finalPath);
+						return false;
+					}
+					await fs.promises.unlink(tmpPath);
+					return true;
+				});
+				cb(null, { filename, path: finalPath, size, duplicate });
+			} catch (err) {
+				cb(err);
+			}
+		});
+		file.stream.pipe(out);
+	},
+	_removeFile(req, file, cb) {
+		// Only drop files this request created; a duplicate belongs to an earlier upload
+		if (file.duplicate) return cb(null);
+		fs.promises.unlink(file.path).then(() => cb(null), cb);
+	}
+});
+
+// --- Variant generation (worker pool) ---
+
+let sharpAvailable;
+const hasSharp = () => {
+	if (sharpAvailable === undefined) {
+		try {
+			require.resolve('sharp');
+			sharpAvailable = true;
+		} catch {
+			sharpAvailable = false;
+			logger.warn("'sharp' is not installed; image thumbnails are disabled.");
+		}
+	}
+	return sharpAvailable;
+};
+
+const pool = {
+	size: Math.max(1, Math.min(2, os.cpus().length - 1)),
+	workers: [],
+	idle: [],
+	queue: [],
+	callbacks: new Map(),
+	nextId: 1
+};
+
+const spawnWorker = () => {
+	const worker = new Worker(path.join(__dirname, 'thumbnailWorker.js'));
+	worker.on('message', ({ id, error }) => {
+		const done = pool.callbacks.get(id);
+		pool.callbacks.delete(id);
+		if (done) done(error);
+		pool.idle.push(worker);
+		drainQueue();
+	});
+	worker.on('error', (err) => {
+		logger.error('Thumbnail worker crashed:', err.message);
+		pool.workers = pool.workers.filter(w => w !== worker);
+		pool.idle = pool.idle.filter(w => w !== worker);
+		// Fail whatever this worker was doing; its job id is no longer tracked
+		for (const [id, done] of pool.callbacks) {
+			if (done.worker === worker) {
+				pool.callbacks.delete(id);
+				done(err.message);
+			}
+		}
+		drainQueue();
+	});
+	worker.unref(); // Do not keep the process alive just for idle workers
+	pool.workers.push(worker);
+	pool.idle.push(worker);
+};
+
+const drainQueue = () => {
+	while (pool.queue.length > 0) {
+		if (pool.idle.length === 0 && pool.workers.length < pool.size) spawnWorker();
+		const worker = pool.idle.pop();
+		if (!worker) return;
+		const { job, done } = pool.queue.shift();
+		done.worker = worker;
+		pool.callbacks.set(job.id, done);
+		worker.postMessage(job);
+	}
+};
+
+// Queue thumbnail/display variants for an uploaded file. Never blocks the caller.
+function scheduleVariants(mediaDir, file) {
+	if (!RESIZABLE_TYPES.includes(file.mimetype) || !hasSharp()) return;
+	const source = path.join(mediaDir, file.filename);
+	const job = {
+		id: pool.nextId++,
+		source,
+		variants: Object.entries(VARIANTS).map(([variant, width]) => ({
+			target: path.join(mediaDir, variantName(file.filename, variant)),
+			width
+		}))
+	};
+	const done = (error) => {
+		if (error) logger.error(`Failed to create variants for ${file.filename}:`, error);
+	};
+	pool.queue.push({ job, done });
+	drainQueue();
+}
+
+// Path of the best available file for a variant: the variant if it has been rendered, else the original
+async function resolveVariant(mediaDir, filename, variant) {
+	const original = path.join(mediaDir, filename);
+	if (!VARIANTS[variant]) return { path: original, isVariant: false };
+	const candidate = path.join(mediaDir, variantName(filename, variant));
+	try {
+		await fs.promises.access(candidate);
+		return { path: candidate, isVariant: true };
+	} catch {
+		return { path: original, isVariant: false };
+	}
+}
+
+// --- Garbage collection ---
+
+// Delete files (and their variants) that no card references and that are older than the grace period.
+// `db` is the Database. Resolves with the number of files removed.
+async function collectMediaGarbage(db, mediaDir, graceSeconds = GC_GRACE_SECONDS) {
+	const cutoff = nowEpoch() - graceSeconds;
+	const candidates = await db.all(
+		`SELECT filename FROM media WHERE refs <= 0 AND created_at < ?`,
+		[cutoff]
+	);
+	let removed = 0;
+	for (const { filename } of candidates) {
+		// Re-check and unlink inside a write transaction: a card may have picked the file up
+		// meanwhile, or a re-upload may have restarted its grace period (see createHashingStorage)
+		const deleted = await db.transaction(async ({ run }) => {
+			const result = await run(
+				`DELETE FROM media WHERE filename = ? AND refs <= 0 AND created_at < ?`,
+				[filename, cutoff]
+			);
+			if (result.changes === 0) return false;
+			const names = [filename, ...Object.keys(VARIANTS).map(v => variantName(filename, v))];
+			await Promise.all(names.map(name =>
+				fs.promises.unlink(path.join(mediaDir, name)).catch(err => {
+					if (err.code !== 'ENOENT') logger.error(`Failed to delete media file ${name}:`, err.message);
+				})
+			));
+			return true;
+		});
+		if (deleted) removed++;
+	}
+	return removed;
+}
+
+module.exports = {
+	HASHED_NAME_PATTERN,
+	GC_GRACE_SECONDS,
+	RESIZABLE_TYPES,
+	initMedia,
+	imageFileFilter,
+	createHashingStorage,
+	scheduleVariants,
+	resolveVariant,
+	collectMediaGarbage
+};
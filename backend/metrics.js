@@ -0,0 +1,161 @@
+// In-process performance metrics, exposed in Prometheus text format on GET /metrics.
+//
+// - http_request_duration_seconds: latency histogram per method, route pattern and status class.
+// - sqlite_query_duration_seconds: histogram per (normalized) SQL statement, fed by the
+//   Database onQuery hook. Statements slower than SLOW_QUERY_MS are also logged.
+// - nodejs_eventloop_lag_seconds: event-loop delay percentiles from perf_hooks.
+//
+// Each histogram family holds at most MAX_SERIES label sets; observations for further ones
+// are counted under an 'other' series, so unexpected SQL or routes cannot grow it without bound.
+
+const { monitorEventLoopDelay } = require('perf_hooks');
+const { logger } = require('./logger');
+
+// Upper bounds in seconds
+const HTTP_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10];
+const QUERY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1];
+const MAX_SERIES = 200;
+const OTHER = 'other';
+
+class Histogram {
+	constructor(buckets) {
+		this.buckets = buckets;
+		this.counts = new Array(buckets.length).fill(0); // Non-cumulative; summed when rendered
+		this.sum = 0;
+		this.count = 0;
+	}
+
+	observe(value) {
+		const i = this.buckets.findIndex(bound => value <= bound);
+		if (i !== -1) this.counts[i]++;
+		this.sum += value;
+		this.count++;
+	}
+}
+
+const escapeLabel = (value) => String(value).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+
+const formatLabels = (labels) =>
+	Object.entries(labels).map(([key, value]) => `${key}="${escapeLabel(value)}"`).join(',');
+
+const OTHER_REQUEST_LABELS = formatLabels({ method: OTHER, route: OTHER, status: OTHER });
+
+// One SQL label per statement shape: whitespace collapsed and '?, ?, ?' lists (IN (...)) folded
+const normalizeSql = (sql) => sql
+	.replace(/\s+/g, ' ')
+	.replace(/\?(\s*,\s*\?)+/g, '?, ...')
+	.trim()
+	.slice(0, 200);
+
+function createMetrics({ slowQueryMs = 100, eventLoopResolutionMs = 20 } = {}) {
+	const requests = new Map(); // labels string -> Histogram
+	const queries = new Map();  // normalized SQL -> Histogram
+	let slowQueries = 0;
+
+	const eventLoop = monitorEventLoopDelay({ resolution: eventLoopResolutionMs });
+	eventLoop.enable();
+	// The sampled delays include the sampling interval itself; report only the excess
+	const lagSeconds = (nanoseconds) => Math.max(0, nanoseconds / 1e6 - eventLoopResolutionMs) / 1000;
+
+	// `overflowKey` is used once the map already holds MAX_SERIES keys
+	const histogramFor = (map, key, overflowKey, buckets) => {
+		let histogram = map.get(key);
+		if (!histogram) {
+			if (map.size >= MAX_SERIES) {
+				if (!map.has(overflowKey)) logger.warn(`More than ${MAX_SERIES} metric series; counting new ones as '${OTHER}'.`);
+				key = overflowKey;
+				histogram = map.get(key);
+			}
+			if (!histogram) {
+				histogram = new Histogram(buckets);
+				map.set(key, histogram);
+			}
+		}
+		return histogram;
+	};
+
+	const observeQuery = (sql, durationMs) => {
+		const normalized = normalizeSql(sql);
+		histogramFor(queries, normalized, OTHER, QUERY_BUCKETS).observe(durationMs / 1000);
+		if (durationMs >= slowQueryMs) {
+			slowQueries++;
+			logger.warn(`Slow query (${durationMs.toFixed(1)} ms): ${normalized}`);
+		}
+	};
+
+	// Express middleware: time every request until the response has been sent
+	const middleware = () => (req, res, next) => {
+		const start = process.hrtime.bigint();
+		res.on('finish', () => {
+			const seconds = Number(process.hrtime.bigint() - start) / 1e9;
+			// Use the route pattern, not the URL, so deck names/ids do not create new series
+			const route = req.route ? req.baseUrl + req.route.path : 'unmatched';
+			const labels = formatLabels({
+				method: req.method,
+				route,
+				status: `${Math.floor(res.statusCode / 100)}xx`
+			});
+			histogramFor(requests, labels, OTHER_REQUEST_LABELS, HTTP_BUCKETS).observe(seconds);
+		});
+		next();
+	};
+
+	const renderHistograms = (lines, name, help, map, labelsFor) => {
+		lines.push(`# HELP ${name} ${help}`, `# TYPE ${name} histogram`);
+		for (const [key, histogram] of map) {
+			const labels = labelsFor(key);
+			const prefix = labels ? `${labels},` : '';
+			let cumulative = 0;
+			histogram.buckets.forEach((bound, i) => {
+				cumulative += histogram.counts[i];
+				lines.push(`${name}_bucket{${prefix}le="${bound}"} ${cumulative}`);
+			});
+			lines.push(`${name}_bucket{${prefix}le="+Inf"} ${histogram.count}`);
+			lines.push(`${name}_sum{${labels}} ${histogram.sum}`);
+			lines.push(`${name}_count{${labels}} ${histogram.count}`);
+		}
+	};
+
+	// Prometheus text exposition format (version 0.0.4)
+	const render = () => {
+		const lines = [];
+		renderHistograms(lines, 'http_request_duration_seconds', 'HTTP request latency by route.',
+			requests, key => key);
+		renderHistograms(lines, 'sqlite_query_duration_seconds', 'SQLite statement execution time.',
+			queries, sql => formatLabels({ sql }));
+
+		lines.push(
+			'# HELP sqlite_slow_queries_total Statements slower than the slow-query threshold.',
+			'# TYPE sqlite_slow_queries_total counter',
+			`sqlite_slow_queries_total ${slowQueries}`
+		);
+
+		lines.push(
+			'# HELP nodejs_eventloop_lag_seconds Event-loop delay since startup.',
+			'# TYPE nodejs_eventloop_lag_seconds gauge'
+		);
+		for (const quantile of [50, 90, 99]) {
+			lines.push(`nodejs_eventloop_lag_seconds{quantile="${quantile / 100}"} ${lagSeconds(eventLoop.percentile(quantile))}`);
+		}
+		lines.push(
+			'# HELP nodejs_eventloop_lag_max_seconds Largest event-loop delay since startup.',
+			'# TYPE nodejs_eventloop_lag_max_seconds gauge',
+			`nodejs_eventloop_lag_max_seconds ${lagSeconds(eventLoop.max)}`
+		);
+
+		const memory = process.memoryUsage();
+		lines.push(
+			'# HELP process_resident_memory_bytes Resident set size.',
+			'# TYPE process_resident_memory_bytes gauge',
+			`process_resident_memory_bytes ${memory.rss}`,
+			'# HELP nodejs_heap_used_bytes V8 heap in use.',
+			'# TYPE nodejs_heap_used_bytes gauge',
+			`nodejs_heap_used_bytes ${memory.heapUsed}`
+		);
+		return lines.join('\n') + '\n';
+	};
+
+	return { observeQuery, middleware, render };
+}
+
+module.exports = { createMetrics, normalizeSql };
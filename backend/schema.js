@@ -0,0 +1,115 @@
+// Database schema: tables, indexes, summary tables/triggers and migrations.
+// Shared by the server (on startup) and the offline scripts, so they always agree on the schema.
+
+const { initSummaries } = require('./summaries');
+const { initBlobs, collectBlobGarbage } = require('./blobs');
+const { initMedia } = require('./media');
+const { CACHE_TABLE: AI_CACHE_TABLE } = require('./aiDefinitions');
+const { logger } = require('./logger');
+
+// Per-card shuffle key: a 32-bit mix of the id (multiplicative hash, then h ^ (h >> 15),
+// spelled (a | b) - (a & b) since SQLite has no XOR). Indexed per deck, so a seeded shuffle
+// reads its pages as index range scans. server.js computes the same value in JS (shuffleKey).
+const HASHED_ID = '((id * 2654435761) & 4294967295)';
+const CARD_SHUFFLE_KEY = `((${HASHED_ID} | (${HASHED_ID} >> 15)) - (${HASHED_ID} & (${HASHED_ID} >> 15)))`;
+
+// Create or upgrade the schema. Call inside one transaction: db.transaction(tx => initSchema(tx, ...)).
+// `mediaDir` is the upload directory whose files are registered in the 'media' table.
+async function initSchema({ run, get, all }, { mediaDir }) {
+	logger.info("Initializing database tables if they don't exist...");
+	await run(`
+		CREATE TABLE IF NOT EXISTS decks (
+			id INTEGER PRIMARY KEY AUTOINCREMENT,
+			name TEXT NOT NULL UNIQUE
+		)
+	`);
+	logger.info("'decks' table verified/created.");
+
+	await run(`
+		CREATE TABLE IF NOT EXISTS cards (
+			id INTEGER PRIMARY KEY AUTOINCREMENT, 
+			deck_id INTEGER NOT NULL, 
+			front_type TEXT NOT NULL DEFAULT 'text', 
+			front_content TEXT NOT NULL, 
+			back_type TEXT NOT NULL DEFAULT 'text', 
+			back_content TEXT NOT NULL, 
+			due_date TEXT NOT NULL,  -- ISO8601 string (kept for API clients, mirrors 'due')
+			due INTEGER NOT NULL DEFAULT 0, -- Due timestamp (unix epoch seconds), used for queue lookups
+			interval REAL NOT NULL DEFAULT 1.0, -- Use REAL for potential fractional days
+			ease_factor REAL NOT NULL DEFAULT 2.5, 
+			mod INTEGER NOT NULL DEFAULT (strftime('%s', 'now')), -- Modification timestamp (unix epoch)
+			FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
+		)
+	`);
+	logger.info("'cards' table verified/created.");
+
+	// Create revlog table
+	await run(`
+		CREATE TABLE IF NOT EXISTS revlog (
+			id INTEGER PRIMARY KEY AUTOINCREMENT,
+			card_id INTEGER NOT NULL,          -- ID of the card reviewed
+			review_time TEXT NOT NULL,       -- ISO8601 timestamp of the review
+			quality INTEGER NOT NULL,          -- Rating (0=Again, 1=Hard, 2=Good, 3=Easy)
+			last_interval REAL NOT NULL,       -- Interval before this review (days)
+			new_interval REAL NOT NULL,        -- Interval after this review (days)
+			new_ease_factor REAL NOT NULL,     -- Ease factor after this review
+			time_taken INTEGER             -- Time taken for review in ms (optional, add later)
+			-- Removed foreign key for simplicity, card_id is enough
+		)
+	`);
+	logger.info("'revlog' table verified/created.");
+
+	// Migrate older databases that only have the ISO 'due_date' column
+	await migrateDueColumn(run, all);
+
+	// Add indexes for performance
+	// (deck_id, due) serves both per-deck lookups and due-queue range scans,
+	// so the old single-column indexes are redundant.
+	await run(`DROP INDEX IF EXISTS idx_cards_deck_id`);
+	await run(`DROP INDEX IF EXISTS idx_cards_due_date`);
+	await run(`CREATE INDEX IF NOT EXISTS idx_cards_deck_due ON cards (deck_id, due)`);
+	await run(`CREATE INDEX IF NOT EXISTS idx_cards_deck_shuffle ON cards (deck_id, ${CARD_SHUFFLE_KEY})`); // Shuffled listing
+	await run(`CREATE INDEX IF NOT EXISTS idx_revlog_card_id ON revlog (card_id)`); // Index for revlog
+	await run(`CREATE INDEX IF NOT EXISTS idx_revlog_review_time ON revlog (review_time)`); // Recent reviews in /api/stats
+	logger.info("Indexes verified/created.");
+
+	// Summary tables for /api/decks and /api/stats (maintained by triggers)
+	await initSummaries(run, all);
+	logger.info("Summary tables verified/created.");
+
+	// Content-addressed store for Excalidraw payloads
+	await initBlobs(run, get, all);
+	const removedBlobs = await collectBlobGarbage(run);
+	logger.info(`Blob store verified/created (${removedBlobs} unreferenced blobs removed).`);
+
+	// Cache for AI-generated definitions
+	await run(AI_CACHE_TABLE);
+
+	// Reference counts for uploaded media (maintained by triggers)
+	await initMedia(run, mediaDir);
+	logger.info("Media table verified/created.");
+}
+
+// Add the integer 'due' column to an existing 'cards' table and backfill it from 'due_date'.
+// Runs inside initSchema()'s transaction.
+// Parsing is done in JS rather than with strftime() because SQLite cannot parse
+// extended-year ISO strings (e.g. '+052616-...') that long intervals produce.
+async function migrateDueColumn(run, all) {
+	const columns = await all(`PRAGMA table_info(cards)`);
+	if (columns.some(col => col.name === 'due')) {
+		return;
+	}
+	logger.info("Migrating 'cards' table: adding integer 'due' column...");
+	await run(`ALTER TABLE cards ADD COLUMN due INTEGER NOT NULL DEFAULT 0`);
+
+	const rows = await all(`SELECT id, due_date FROM cards`);
+	const nowEpoch = Math.floor(Date.now() / 1000);
+	for (const row of rows) {
+		const parsed = Date.parse(row.due_date);
+		const due = isNaN(parsed) ? nowEpoch : Math.floor(parsed / 1000);
+		await run(`UPDATE cards SET due = ? WHERE id = ?`, [due, row.id]);
+	}
+	logger.info(`Backfilled 'due' for ${rows.length} cards.`);
+}
+
+module.exports = { CARD_SHUFFLE_KEY, initSchema };
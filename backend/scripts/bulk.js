@@ -0,0 +1,87 @@
+// Bulk import/export from the command line (works while the server is running).
+// Usage:
+//   npm run import -- <file> [--format csv|tsv|json] [--deck Name]
+//   npm run export -- <deck> [--format csv|tsv|json] [--out file]
+// The format defaults to the file extension (import) or json (export). Without --out the
+// export is written to stdout. The legacy data/flashcards_data.json can be imported as is.
+
+// Keep stdout for exported data: only warnings and errors from the shared modules
+process.env.LOG_LEVEL = process.env.LOG_LEVEL || 'warn';
+
+const fs = require('fs');
+const path = require('path');
+const { once } = require('events');
+const { Database } = require('../db');
+const { initSchema } = require('../schema');
+const bulk = require('../bulk');
+
+const DB_FILE = process.env.DB_FILE || path.join(__dirname, '..', 'flashcards.db');
+const MEDIA_DIR = path.join(__dirname, '..', 'user_media');
+
+const parseOptions = (args) => {
+	const options = { positional: [] };
+	for (let i = 0; i < args.length; i++) {
+		if (args[i].startsWith('--')) options[args[i].slice(2)] = args[++i];
+		else options.positional.push(args[i]);
+	}
+	return options;
+};
+
+async function runImport(db, options) {
+	const [file] = options.positional;
+	if (!file) throw new Error('Usage: import <file> [--format csv|tsv|json] [--deck Name]');
+	const format = options.format || bulk.detectFormat(path.extname(file));
+	if (!bulk.FORMATS[format]) throw new Error(`Cannot tell the format of '${file}'; pass --format`);
+
+	const started = Date.now();
+	const summary = await bulk.importCards(db, fs.createReadStream(file), {
+		format,
+		deck: options.deck || 'Default',
+		onProgress: ({ imported, skipped }) => process.stderr.write(`\rImported ${imported} cards (${skipped} skipped)`)
+	});
+	process.stderr.write('\n');
+	for (const { line, error } of summary.errors) {
+		console.error(`  line ${line}: ${error}`);
+	}
+	console.error(`Imported ${summary.imported} cards into ${summary.decks.join(', ') || 'no decks'} in ${((Date.now() - started) / 1000).toFixed(1)}s.`);
+}
+
+async function runExport(db, options) {
+	const [deckName] = options.positional;
+	if (!deckName) throw new Error('Usage: export <deck> [--format csv|tsv|json] [--out file]');
+	const format = options.format || (options.out && bulk.detectFormat(path.extname(options.out))) || 'json';
+	if (!bulk.FORMATS[format]) throw new Error(`Unsupported format '${format}'`);
+
+	const out = options.out ? fs.createWriteStream(options.out) : process.stdout;
+	const count = await bulk.exportDeck(db, deckName, format, (text) => {
+		if (!out.write(text)) return once(out, 'drain');
+	});
+	if (count === null) throw new Error(`Deck '${deckName}' not found`);
+	if (options.out) {
+		out.end();
+		await once(out, 'finish');
+	}
+	console.error(`Exported ${count} cards from '${deckName}'.`);
+}
+
+const COMMANDS = { import: runImport, export: runExport };
+
+(async () => {
+	const [command, ...args] = process.argv.slice(2);
+	if (!COMMANDS[command]) {
+		console.error('Usage: node scripts/bulk.js import|export ...');
+		process.exitCode = 1;
+		return;
+	}
+	const db = new Database(DB_FILE);
+	try {
+		await db.open();
+		await db.transaction(tx => initSchema(tx, { mediaDir: MEDIA_DIR }));
+		await COMMANDS[command](db, parseOptions(args));
+	} catch (err) {
+		console.error(`${command} failed:`, err.message);
+		process.exitCode = 1;
+	} finally {
+		await db.close();
+	}
+})();
@@ -0,0 +1,24 @@
+// Recompute the summary tables (deck_due_counts, revlog_daily) from cards and revlog.
+// Usage: npm run rebuild-summaries (set DB_FILE to rebuild a database other than flashcards.db)
+const path = require('path');
+const { Database } = require('../db');
+const { initSummaries, rebuildSummaries } = require('../summaries');
+
+const DB_FILE = process.env.DB_FILE || path.join(__dirname, '..', 'flashcards.db');
+const db = new Database(DB_FILE);
+
+(async () => {
+	try {
+		await db.open();
+		await db.transaction(async ({ run, all }) => {
+			await initSummaries(run, all);
+			await rebuildSummaries(run);
+		});
+		console.log('Summary tables rebuilt.');
+	} catch (err) {
+		console.error('Error rebuilding summary tables:', err.message);
+		process.exitCode = 1;
+	} finally {
+		await db.close();
+	}
+})();
@@ -1,11 +1,19 @@
+require('dotenv').config(); // Load .env before any module reads process.env (logger.js does on require)
 const express = require('express');
 const cors = require('cors');
 const fs = require('fs').promises;
 const path = require('path');
 const multer = require('multer'); // Import multer
-const sqlite3 = require('sqlite3').verbose(); // Import sqlite3
-const { GoogleGenerativeAI, HarmCategory, HarmBlockThreshold } = require('@google/generative-ai');
-require('dotenv').config();
+const { Database } = require('./db'); // SQLite access layer (WAL, statement cache, read pool)
+const { HarmCategory, HarmBlockThreshold } = require('@google/generative-ai');
+const { SECONDS_PER_DAY } = require('./summaries');
+const { BLOB_HASH_PATTERN, loadBlob, encodeCardContent, storeCardContent, cardBlobHashes, collectBlobGarbage } = require('./blobs');
+const { CARD_SHUFFLE_KEY, initSchema } = require('./schema');
+const { logger } = require('./logger'); // Async, level-controlled logging (LOG_LEVEL, LOG_SAMPLE_RATE)
+const { createMetrics } = require('./metrics');
+const aiDefinitions = require('./aiDefinitions');
+const media = require('./media');
+const bulk = require('./bulk');
 
 const app = express();
 const PORT = process.env.PORT || 5001; // Port for the backend server
@@ -17,103 +25,87 @@ const CARDS_DATA_FILE = path.join(DATA_DIR, 'flashcards_data.json');
 const STATS_DATA_FILE = path.join(DATA_DIR, 'flashcards_stats.json');
 const DEFAULT_CARDS_DATA = { decks: { Default: { cards: [] } } };
 const DEFAULT_STATS_DATA = [];
+const AI_BACKEND = process.env.AI_BACKEND || 'gemini'; // 'gemini' or 'stub' (local, for load tests)
+const AI_CACHE_TTL_SECONDS = parseInt(process.env.AI_CACHE_TTL_SECONDS, 10) || 7 * 24 * 60 * 60;
+const SLOW_QUERY_MS = parseFloat(process.env.SLOW_QUERY_MS) || 100; // Statements slower than this are logged
+
+// --- Instrumentation (served on GET /metrics) ---
+const metrics = createMetrics({ slowQueryMs: SLOW_QUERY_MS });
 
 // --- Database Setup ---
-const DB_FILE = path.join(__dirname, 'flashcards.db');
-const db = new sqlite3.Database(DB_FILE, (err) => {
-	if (err) {
-		console.error("Error opening database", err.message);
-	} else {
-		console.log('Connected to the SQLite database.');
-		initDB(); // Initialize tables after connection
-	}
-});
+const DB_FILE = process.env.DB_FILE || path.join(__dirname, 'flashcards.db'); // Overridable for benchmarks
+const db = new Database(DB_FILE, { onQuery: metrics.observeQuery });
+db.open()
+	.then(() => {
+		logger.info('Connected to the SQLite database.');
+		return initDB(); // Initialize tables after connection
+	})
+	.then(() => db.openReaders()) // Readers need the schema to exist
+	.then(() => logger.info(`Opened ${db.readers.length} read-only database connections.`))
+	.catch((err) => logger.error("Error opening database", err.message));
 
 // Function to initialize database tables
+// Schema creation and migrations run in one transaction on the writer connection.
 async function initDB() {
-	// Use async/await with db.run for cleaner syntax (requires wrapping db methods)
-	const run = (query, params = []) => new Promise((resolve, reject) => {
-		db.run(query, params, function (err) { // Use function() to access this.lastID
-			if (err) reject(err);
-			else resolve({ lastID: this.lastID, changes: this.changes });
-		});
-	});
-
 	try {
-		console.log("Initializing database tables if they don't exist...");
-		await run(`
-			CREATE TABLE IF NOT EXISTS decks (
-				id INTEGER PRIMARY KEY AUTOINCREMENT,
-				name TEXT NOT NULL UNIQUE
-			)
-		`);
-		console.log("'decks' table verified/created.");
-
-		await run(`
-			CREATE TABLE IF NOT EXISTS cards (
-				id INTEGER PRIMARY KEY AUTOINCREMENT, 
-				deck_id INTEGER NOT NULL, 
-				front_type TEXT NOT NULL DEFAULT 'text', 
-				front_content TEXT NOT NULL, 
-				back_type TEXT NOT NULL DEFAULT 'text', 
-				back_content TEXT NOT NULL, 
-				due_date TEXT NOT NULL,  -- ISO8601 string
-				interval REAL NOT NULL DEFAULT 1.0, -- Use REAL for potential fractional days
-				ease_factor REAL NOT NULL DEFAULT 2.5, 
-				mod INTEGER NOT NULL DEFAULT (strftime('%s', 'now')), -- Modification timestamp (unix epoch)
-				FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE
-			)
-		`);
-		console.log("'cards' table verified/created.");
-
-		// Create revlog table
-		await run(`
-			CREATE TABLE IF NOT EXISTS revlog (
-				id INTEGER PRIMARY KEY AUTOINCREMENT,
-				card_id INTEGER NOT NULL,          -- ID of the card reviewed
-				review_time TEXT NOT NULL,       -- ISO8601 timestamp of the review
-				quality INTEGER NOT NULL,          -- Rating (0=Again, 1=Hard, 2=Good, 3=Easy)
-				last_interval REAL NOT NULL,       -- Interval before this review (days)
-				new_interval REAL NOT NULL,        -- Interval after this review (days)
-				new_ease_factor REAL NOT NULL,     -- Ease factor after this review
-				time_taken INTEGER             -- Time taken for review in ms (optional, add later)
-				-- Removed foreign key for simplicity, card_id is enough
-			)
-		`);
-		console.log("'revlog' table verified/created.");
-
-		// Add indexes for performance
-		await run(`CREATE INDEX IF NOT EXISTS idx_cards_deck_id ON cards (deck_id)`);
-		await run(`CREATE INDEX IF NOT EXISTS idx_cards_due_date ON cards (due_date)`);
-		await run(`CREATE INDEX IF NOT EXISTS idx_revlog_card_id ON revlog (card_id)`); // Index for revlog
-		console.log("Indexes verified/created.");
-
-		console.log("Database initialization complete.");
+		await db.transaction(tx => initSchema(tx, { mediaDir: MEDIA_DIR }));
+		logger.info("Database initialization complete.");
 
 	} catch (err) {
-		console.error("Error initializing database:", err.message);
+		logger.error("Error initializing database:", err.message);
 		// Consider exiting if DB init fails?
 	}
 }
 
 // --- Middleware ---
+app.use(metrics.middleware()); // First, so the histograms cover the whole request
 app.use(cors()); // Allow requests from frontend (React app)
-app.use(express.json({ limit: '50mb' })); // Allow large Excalidraw data
-app.use('/media', express.static(MEDIA_DIR));
+// Allow large Excalidraw data. Imports read their body as a stream instead (see POST /api/import).
+const jsonParser = express.json({ limit: '50mb' });
+app.use((req, res, next) => (req.path === '/api/import' ? next() : jsonParser(req, res, next)));
+
+// Uploaded files are shown inline, so browsers must not sniff them into HTML or run anything
+// in them (files from before uploads were limited to images may still be around)
+app.use('/media', (req, res, next) => {
+	res.setHeader('X-Content-Type-Options', 'nosniff');
+	res.setHeader('Content-Security-Policy', "default-src 'none'; sandbox");
+	next();
+});
 
-// --- Multer Configuration for File Uploads ---
-const storage = multer.diskStorage({
-	destination: function (req, file, cb) {
-		cb(null, MEDIA_DIR);
-	},
-	filename: function (req, file, cb) {
-		// Add timestamp prefix to avoid name collisions
-		const uniquePrefix = Date.now() + '-';
-		cb(null, uniquePrefix + file.originalname);
+// Resized variants: /media/thumb/<file> and /media/display/<file>.
+// Falls back to the original until the background worker has rendered the variant.
+app.get('/media/:variant(thumb|display)/:filename', async (req, res, next) => {
+	const { variant, filename } = req.params;
+	if (filename !== path.basename(filename)) {
+		return res.status(400).json({ error: 'Invalid file name' });
 	}
+	const file = await media.resolveVariant(MEDIA_DIR, filename, variant);
+	// Only a finished variant may be cached for long; the fallback will be replaced soon
+	const cacheControl = file.isVariant && media.HASHED_NAME_PATTERN.test(filename)
+		? 'public, max-age=31536000, immutable'
+		: 'no-cache';
+	res.sendFile(file.path, { headers: { 'Cache-Control': cacheControl } }, (err) => {
+		if (err && !res.headersSent) next();
+	});
 });
 
-const upload = multer({ storage: storage });
+app.use('/media', express.static(MEDIA_DIR, {
+	setHeaders: (res, filePath) => {
+		// Hashed names never change content, so browsers can keep them forever
+		if (media.HASHED_NAME_PATTERN.test(path.basename(filePath))) {
+			res.setHeader('Cache-Control', 'public, max-age=31536000, immutable');
+		}
+	}
+}));
+
+// --- Multer Configuration for File Uploads ---
+// Files are stored under the SHA-256 of their content, so duplicates are kept once.
+// Only raster images are accepted (see media.imageFileFilter).
+const upload = multer({
+	storage: media.createHashingStorage(db, MEDIA_DIR),
+	fileFilter: media.imageFileFilter,
+	limits: { fileSize: 20 * 1024 * 1024 }
+});
 
 // --- Utility Functions ---
 
@@ -124,9 +116,9 @@ const ensureDataDirExists = async () => {
 	} catch (error) {
 		if (error.code === 'ENOENT') {
 			await fs.mkdir(DATA_DIR);
-			console.log(`Created data directory: ${DATA_DIR}`);
+			logger.debug(`Created data directory: ${DATA_DIR}`);
 		} else {
-			console.error("Error checking data directory:", error);
+			logger.error("Error checking data directory:", error);
 			throw error; // Re-throw other errors
 		}
 	}
@@ -140,17 +132,17 @@ const loadJsonFile = async (filePath, defaultData) => {
 		return JSON.parse(rawData);
 	} catch (error) {
 		if (error.code === 'ENOENT') {
-			console.log(`File not found: ${filePath}. Creating with default data.`);
+			logger.debug(`File not found: ${filePath}. Creating with default data.`);
 			await saveJsonFile(filePath, defaultData);
 			return defaultData;
 		} else if (error instanceof SyntaxError) {
-			console.error(`Error parsing JSON from ${filePath}:`, error);
+			logger.error(`Error parsing JSON from ${filePath}:`, error);
 			// Decide how to handle corrupted JSON (e.g., return default, throw error)
-			console.log('Returning default data due to JSON parse error.');
+			logger.debug('Returning default data due to JSON parse error.');
 			await saveJsonFile(filePath, defaultData); // Overwrite corrupted file
 			return defaultData;
 		} else {
-			console.error(`Error reading file ${filePath}:`, error);
+			logger.error(`Error reading file ${filePath}:`, error);
 			throw error; // Re-throw other errors
 		}
 	}
@@ -163,17 +155,89 @@ const saveJsonFile = async (filePath, data) => {
 		const jsonData = JSON.stringify(data, null, 4); // Pretty print JSON
 		await fs.writeFile(filePath, jsonData, 'utf-8');
 	} catch (error) {
-		console.error(`Error writing file ${filePath}:`, error);
+		logger.error(`Error writing file ${filePath}:`, error);
 		throw error;
 	}
 };
 
-// Simplified Spaced Repetition Logic (Ported from Python)
-const updateCardSchedule = (card, quality) => {
+// Convert a Date to unix epoch seconds (the unit used by 'due' and 'mod')
+const toEpochSeconds = (date) => Math.floor(date.getTime() / 1000);
+
+// Cards are due for the whole of their due day (UTC), matching the old
+// `date(due_date) <= date('now')` semantics: anything before tomorrow 00:00 UTC.
+const endOfTodayEpoch = () => {
 	const now = new Date();
+	return Date.UTC(now.getUTCFullYear(), now.getUTCMonth(), now.getUTCDate() + 1) / 1000;
+};
+
+// Parse an optional positive integer 'limit' query parameter.
+// Returns -1 (no limit in SQLite) when absent, null when invalid.
+const parseLimit = (value) => {
+	if (value === undefined) return -1;
+	const limit = Number(value);
+	if (!Number.isInteger(limit) || limit <= 0) return null;
+	return limit;
+};
+
+// Columns a card listing may project with ?fields= ('id' is always included)
+const CARD_FIELDS = [
+	'id', 'deck_id', 'front_type', 'front_content', 'back_type', 'back_content',
+	'due_date', 'due', 'interval', 'ease_factor', 'mod'
+];
+const DEFAULT_PAGE_SIZE = 100;
+const MAX_PAGE_SIZE = 1000;
+
+// Parse a comma-separated ?fields= list. Returns null when it names an unknown column.
+// The result is canonical (CARD_FIELDS order, no duplicates, always 'id'), so every way of
+// asking for the same columns builds the same SQL and shares one cached statement.
+const parseFields = (value) => {
+	if (value === undefined || value === '') return CARD_FIELDS;
+	const requested = String(value).split(',').map(f => f.trim()).filter(Boolean);
+	if (requested.some(f => !CARD_FIELDS.includes(f))) return null;
+	return CARD_FIELDS.filter(f => f === 'id' || requested.includes(f));
+};
+
+// Shuffle key of a card id, the JS twin of CARD_SHUFFLE_KEY in schema.js (unique per id)
+const SHUFFLE_KEY_SPACE = 2 ** 32;
+const shuffleKey = (id) => {
+	const h = Math.imul(id, 2654435761) >>> 0;
+	return (h ^ (h >>> 15)) >>> 0;
+};
+
+// Where a seeded shuffle starts in the key space (32-bit integer mix of the seed).
+// A shuffled listing walks the deck in key order from there, wrapping around once.
+const shuffleStart = (seed) => {
+	let h = Math.imul(seed, 0x9e3779b1);
+	h = Math.imul(h ^ (h >>> 16), 0x85ebca6b);
+	h = Math.imul(h ^ (h >>> 13), 0xc2b2ae35);
+	return (h ^ (h >>> 16)) >>> 0;
+};
+
+// Key ranges [from, to) still to list after the card with key `afterKey` (null: from the start)
+const shuffleRanges = (start, afterKey) => {
+	if (afterKey === null) return [[start, SHUFFLE_KEY_SPACE], [0, start]];
+	if (afterKey >= start) return [[afterKey + 1, SHUFFLE_KEY_SPACE], [0, start]];
+	return [[afterKey + 1, start]];
+};
+
+// Resolves once `res` can take more data or the client has gone away.
+// Both listeners are removed when either fires, so long streams do not pile up 'close' listeners.
+const waitForDrain = (res) => new Promise(resolve => {
+	const done = () => {
+		res.off('drain', done);
+		res.off('close', done);
+		resolve();
+	};
+	res.on('drain', done);
+	res.on('close', done);
+});
+
+// Simplified Spaced Repetition Logic (Ported from Python)
+// `now` defaults to the current time; batched reviews pass the time the card was actually reviewed.
+const updateCardSchedule = (card, quality, now = new Date()) => {
 	let interval = card.interval || 1;
 	let easeFactor = card.ease_factor || 2.5;
-	let dueDateISO;
+	let dueDate;
 
 	if (quality < 2) { // 0: Again, 1: Hard
 		// Reset interval for both Again and Hard, as session handles immediate review
@@ -184,7 +248,7 @@ const updateCardSchedule = (card, quality) => {
 		// but session logic primarily controls 'Again' cards now.
 		// Use a longer delay for Hard than Again. 
 		const delayMinutes = quality === 0 ? 1 : 5; // e.g., 1 min for Again, 5 mins for Hard
-		dueDateISO = new Date(now.getTime() + delayMinutes * 60 * 1000).toISOString();
+		dueDate = new Date(now.getTime() + delayMinutes * 60 * 1000);
 
 	} else { // 2: Good, 3: Easy
 		if (interval <= 1) { // First successful review or coming from reset
@@ -198,61 +262,44 @@ const updateCardSchedule = (card, quality) => {
 		}
 		easeFactor = easeFactor + (quality === 3 ? 0.15 : 0); // Slightly larger boost for Easy? Adjusted from 0.1
 		// Calculate due date based on the new interval (in days)
-		dueDateISO = new Date(now.getTime() + interval * 24 * 60 * 60 * 1000).toISOString();
+		dueDate = new Date(now.getTime() + interval * 24 * 60 * 60 * 1000);
 	}
 
 	// Assign updated values back to the card object
 	card.interval = interval;
 	card.ease_factor = easeFactor;
-	card.due_date = dueDateISO;
+	card.due_date = dueDate.toISOString();
+	card.due = toEpochSeconds(dueDate);
 	// console.log(`Updated Card Schedule: Quality=${quality}, Interval=${card.interval}d, Ease=${card.ease_factor.toFixed(2)}, Due=${card.due_date}`);
 };
 
 // --- API Endpoints (Refactoring for SQLite) ---
 
-// Helper function to run SELECT queries that return multiple rows
-const all = (query, params = []) => new Promise((resolve, reject) => {
-	db.all(query, params, (err, rows) => {
-		if (err) reject(err);
-		else resolve(rows);
-	});
-});
-
-// Helper function to run SELECT query that returns a single row
-const get = (query, params = []) => new Promise((resolve, reject) => {
-	db.get(query, params, (err, row) => {
-		if (err) reject(err);
-		else resolve(row);
-	});
-});
-
-// Helper function to run INSERT/UPDATE/DELETE queries
-const run = (query, params = []) => new Promise((resolve, reject) => {
-	db.run(query, params, function (err) { // Use function() to access this.lastID/changes
-		if (err) reject(err);
-		// For INSERT, return lastID. For UPDATE/DELETE, return changes.
-		else resolve({ lastID: this.lastID, changes: this.changes });
-	});
-});
+// Query helpers, backed by the data-access layer in db.js:
+// all/get/each read from the read-only pool, run queues a write on the writer connection,
+// and transaction(work) runs work(tx) as one transaction with tx.all/get/run/each on the writer.
+// Statements are prepared once per connection and reused.
+const { all, get, each, run, transaction } = db;
 
 // Get all decks (names and counts - refactored for SQLite)
 app.get('/api/decks', async (req, res) => {
-	console.log('GET /api/decks request received');
+	logger.debug('GET /api/decks request received');
 	try {
-		// Query to get deck names and count cards for each deck
+		// Query to get deck names and counts from the per-deck, per-due-day summary table
 		const query = `
 			SELECT 
 				d.id, 
 				d.name, 
-				COUNT(c.id) as card_count,
-				SUM(CASE WHEN date(c.due_date) <= date('now') THEN 1 ELSE 0 END) as due_count,
-				SUM(CASE WHEN date(c.due_date) <= date('now') AND c.interval <= 1 THEN 1 ELSE 0 END) as new_count
+				SUM(s.cards) as card_count,
+				SUM(CASE WHEN s.due_day <= ?1 THEN s.cards ELSE 0 END) as due_count,
+				SUM(CASE WHEN s.due_day <= ?1 THEN s.new_cards ELSE 0 END) as new_count
 			FROM decks d
-			LEFT JOIN cards c ON d.id = c.deck_id
+			LEFT JOIN deck_due_counts s ON s.deck_id = d.id
 			GROUP BY d.id, d.name
 			ORDER BY d.name COLLATE NOCASE;
 		`;
-		const decksWithCounts = await all(query);
+		const todayDay = endOfTodayEpoch() / SECONDS_PER_DAY - 1;
+		const decksWithCounts = await all(query, [todayDay]);
 
 		// Map to expected frontend format (id is not usually needed on frontend deck list)
 		const frontendDecks = decksWithCounts.map(d => ({
@@ -265,14 +312,14 @@ app.get('/api/decks', async (req, res) => {
 		res.json(frontendDecks);
 
 	} catch (error) {
-		console.error("Error loading decks from DB:", error.message);
+		logger.error("Error loading decks from DB:", error.message);
 		res.status(500).json({ message: "Error loading decks", error: error.message });
 	}
 });
 
 // Create a new deck (refactored for SQLite)
 app.post('/api/decks', async (req, res) => {
-	console.log('POST /api/decks request received');
+	logger.debug('POST /api/decks request received');
 	const deckName = req.body.name; // Assuming name comes in body.name now
 
 	if (!deckName || typeof deckName !== 'string' || deckName.trim() === '') {
@@ -289,7 +336,7 @@ app.post('/api/decks', async (req, res) => {
 
 		// Insert the new deck
 		const result = await run(`INSERT INTO decks (name) VALUES (?)`, [trimmedDeckName]);
-		console.log(`Added new deck: '${trimmedDeckName}' with ID ${result.lastID}`);
+		logger.debug(`Added new deck: '${trimmedDeckName}' with ID ${result.lastID}`);
 
 		// Return the newly created deck info (matching the GET format)
 		res.status(201).json({
@@ -300,7 +347,7 @@ app.post('/api/decks', async (req, res) => {
 		});
 
 	} catch (error) {
-		console.error("Error adding deck to DB:", error.message);
+		logger.error("Error adding deck to DB:", error.message);
 		// Check for UNIQUE constraint error specifically
 		if (error.message.includes('UNIQUE constraint failed')) {
 			return res.status(409).json({ error: `Deck '${trimmedDeckName}' already exists` });
@@ -309,10 +356,118 @@ app.post('/api/decks', async (req, res) => {
 	}
 });
 
+// List cards of a deck page by page (keyset pagination on id).
+// Query parameters:
+//   after=<id>      return cards after this one (use nextCursor from the previous page)
+//   limit=N         page size (default 100, max 1000); with format=ndjson the default is the whole deck
+//   fields=a,b      only return these columns (id is always included), e.g. fields=front_type,due
+//   shuffle=<seed>  random but repeatable order for this seed; `after` still takes the last id seen
+//   format=ndjson   stream one JSON card per line instead of a { cards, nextCursor } page
+app.get('/api/decks/:deckName/cards', async (req, res) => {
+	const { deckName } = req.params;
+	const { after, shuffle, format } = req.query;
+	logger.debug(`GET /api/decks/${deckName}/cards request received`);
+
+	// Validate input
+	const fields = parseFields(req.query.fields);
+	if (!fields) {
+		return res.status(400).json({ error: `Invalid fields. Allowed: ${CARD_FIELDS.join(', ')}` });
+	}
+	const streaming = format === 'ndjson';
+	if (format !== undefined && !streaming) {
+		return res.status(400).json({ error: "Invalid format. Only 'ndjson' is supported." });
+	}
+	let limit = parseLimit(req.query.limit);
+	if (limit === null || limit > MAX_PAGE_SIZE && !streaming) {
+		return res.status(400).json({ error: `Invalid limit. Must be an integer between 1 and ${MAX_PAGE_SIZE}.` });
+	}
+	if (limit === -1 && !streaming) limit = DEFAULT_PAGE_SIZE;
+	const afterId = after === undefined ? null : Number(after);
+	if (afterId !== null && !Number.isInteger(afterId)) {
+		return res.status(400).json({ error: 'Invalid after cursor. Must be a card ID.' });
+	}
+	const seed = shuffle === undefined ? null : Number(shuffle);
+	if (seed !== null && !Number.isInteger(seed)) {
+		return res.status(400).json({ error: 'Invalid shuffle seed. Must be an integer.' });
+	}
+
+	try {
+		// 1. Find the deck ID
+		const deck = await get(`SELECT id FROM decks WHERE name = ?`, [deckName]);
+		if (!deck) {
+			return res.status(404).json({ error: `Deck '${deckName}' not found` });
+		}
+		const deckId = deck.id;
+		const columns = fields.join(', ');
+
+		// 2. Load one chunk of at most `size` cards following the card `cursor`, calling onRow in
+		// listing order. Both orders are keyset ranges on an index: ids on the primary key, or in
+		// shuffled order the cards' shuffle keys on idx_cards_deck_shuffle, starting at the seed's
+		// point and wrapping around once.
+		const CHUNK_SIZE = 500;
+		const loadChunk = async (cursor, size, onRow) => {
+			if (seed !== null) {
+				let count = 0;
+				for (const [from, to] of shuffleRanges(shuffleStart(seed), cursor === null ? null : shuffleKey(cursor))) {
+					if (count === size) break;
+					count += await each(
+						`SELECT ${columns} FROM cards
+						WHERE deck_id = ? AND ${CARD_SHUFFLE_KEY} >= ? AND ${CARD_SHUFFLE_KEY} < ?
+						ORDER BY ${CARD_SHUFFLE_KEY} LIMIT ?`,
+						[deckId, from, to, size - count],
+						onRow
+					);
+				}
+				return count;
+			}
+			return each(
+				`SELECT ${columns} FROM cards WHERE deck_id = ? AND id > ? ORDER BY id LIMIT ?`,
+				[deckId, cursor === null ? -1 : cursor, size],
+				onRow
+			);
+		};
+
+		// 3a. Page mode: one chunk, returned with the cursor for the next page
+		if (!streaming) {
+			const cards = [];
+			const count = await loadChunk(afterId, limit, row => cards.push(row));
+			return res.json({ cards, nextCursor: count === limit ? cards[cards.length - 1].id : null });
+		}
+
+		// 3b. Streaming mode: NDJSON in chunks, waiting for the socket to drain between chunks
+		res.setHeader('Content-Type', 'application/x-ndjson; charset=utf-8');
+		let cursor = afterId;
+		let remaining = limit === -1 ? Infinity : limit;
+		let streamed = 0;
+		while (remaining > 0 && !res.destroyed) {
+			const size = Math.min(CHUNK_SIZE, remaining);
+			const count = await loadChunk(cursor, size, row => {
+				res.write(JSON.stringify(row) + '\n');
+				cursor = row.id;
+			});
+			streamed += count;
+			remaining -= count;
+			if (count < size) break;
+			if (res.writableNeedDrain) {
+				await waitForDrain(res);
+			}
+		}
+		res.end();
+		logger.debug(`Streamed ${streamed} cards for deck '${deckName}'`);
+
+	} catch (error) {
+		logger.error(`Error listing cards for deck '${deckName}':`, error.message);
+		if (res.headersSent) {
+			return res.destroy(error);
+		}
+		res.status(500).json({ message: "Error loading cards", error: error.message });
+	}
+});
+
 // Get all cards for a specific deck (refactored for SQLite)
 app.get('/api/decks/:deckName/cards/all', async (req, res) => {
 	const { deckName } = req.params;
-	console.log(`GET /api/decks/${deckName}/cards/all request received`);
+	logger.debug(`GET /api/decks/${deckName}/cards/all request received`);
 
 	try {
 		// 1. Find the deck ID
@@ -324,7 +479,7 @@ app.get('/api/decks/:deckName/cards/all', async (req, res) => {
 
 		// 2. Get all cards for this deck
 		const cards = await all(`SELECT * FROM cards WHERE deck_id = ? ORDER BY id`, [deckId]);
-		console.log(`Found ${cards.length} total cards for deck '${deckName}' (Study All)`);
+		logger.debug(`Found ${cards.length} total cards for deck '${deckName}' (Study All)`);
 
 		// Optional: Shuffle cards before sending?
 		// Fisher-Yates shuffle:
@@ -336,7 +491,7 @@ app.get('/api/decks/:deckName/cards/all', async (req, res) => {
 		res.json(cards);
 
 	} catch (error) {
-		console.error(`Error loading all cards for deck '${deckName}':`, error.message);
+		logger.error(`Error loading all cards for deck '${deckName}':`, error.message);
 		res.status(500).json({ message: "Error loading cards", error: error.message });
 	}
 });
@@ -344,7 +499,13 @@ app.get('/api/decks/:deckName/cards/all', async (req, res) => {
 // Get due cards for a specific deck (refactored for SQLite)
 app.get('/api/decks/:deckName/cards/due', async (req, res) => {
 	const { deckName } = req.params;
-	console.log(`GET /api/decks/${deckName}/cards/due request received`);
+	logger.debug(`GET /api/decks/${deckName}/cards/due request received`);
+
+	// Optional: only fetch the next N due cards (earliest first)
+	const limit = parseLimit(req.query.limit);
+	if (limit === null) {
+		return res.status(400).json({ error: 'Invalid limit. Must be a positive integer.' });
+	}
 
 	try {
 		// 1. Find the deck ID
@@ -356,10 +517,10 @@ app.get('/api/decks/:deckName/cards/due', async (req, res) => {
 
 		// 2. Get due cards for this deck
 		const dueCards = await all(
-			`SELECT * FROM cards WHERE deck_id = ? AND date(due_date) <= date('now') ORDER BY due_date`,
-			[deckId]
+			`SELECT * FROM cards WHERE deck_id = ? AND due < ? ORDER BY due LIMIT ?`,
+			[deckId, endOfTodayEpoch(), limit]
 		);
-		console.log(`Found ${dueCards.length} due cards for deck '${deckName}'`);
+		logger.debug(`Found ${dueCards.length} due cards for deck '${deckName}'`);
 
 		// Optional: Shuffle due cards?
 		for (let i = dueCards.length - 1; i > 0; i--) {
@@ -370,7 +531,7 @@ app.get('/api/decks/:deckName/cards/due', async (req, res) => {
 		res.json(dueCards);
 
 	} catch (error) {
-		console.error(`Error loading due cards for deck '${deckName}':`, error.message);
+		logger.error(`Error loading due cards for deck '${deckName}':`, error.message);
 		res.status(500).json({ message: "Error loading due cards", error: error.message });
 	}
 });
@@ -379,7 +540,7 @@ app.get('/api/decks/:deckName/cards/due', async (req, res) => {
 app.post('/api/decks/:deckName/cards', async (req, res) => {
 	const { deckName } = req.params;
 	const { front_type, front_content, back_type, back_content } = req.body;
-	console.log(`POST /api/decks/${deckName}/cards request received`);
+	logger.debug(`POST /api/decks/${deckName}/cards request received`);
 
 	// Validate input
 	if (!front_type || !front_content || !back_type || !back_content) {
@@ -397,37 +558,36 @@ app.post('/api/decks/:deckName/cards', async (req, res) => {
 		}
 		const deckId = deck.id;
 
-		// 2. Prepare content (minify Excalidraw)
-		let final_front_content = front_content;
-		if (front_type === 'excalidraw') {
-			try { final_front_content = JSON.stringify(JSON.parse(front_content)); } catch (e) { /* ignore parse error, save as is */ }
-		}
-		let final_back_content = back_content;
-		if (back_type === 'excalidraw') {
-			try { final_back_content = JSON.stringify(JSON.parse(back_content)); } catch (e) { /* ignore parse error, save as is */ }
-		}
-
-		// 3. Set initial scheduling values
-		const initialDueDate = new Date().toISOString();
+		// 2. Set initial scheduling values
+		const now = new Date();
+		const initialDueDate = now.toISOString();
+		const initialDue = toEpochSeconds(now);
 		const initialInterval = 1.0;
 		const initialEaseFactor = 2.5;
 
-		// 4. Insert the new card
-		const query = `
-			INSERT INTO cards 
-			(deck_id, front_type, front_content, back_type, back_content, due_date, interval, ease_factor)
-			VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-		`;
-		const params = [
-			deckId,
-			front_type, final_front_content,
-			back_type, final_back_content,
-			initialDueDate, initialInterval, initialEaseFactor
-		];
-		const result = await run(query, params);
-		const newCardId = result.lastID;
+		// 3. Minify, hash and compress drawings before taking the writer
+		const encodedFront = await encodeCardContent(get, front_type, front_content);
+		const encodedBack = await encodeCardContent(get, back_type, back_content);
+
+		// 4. Store the drawings in the blob store and insert the card in one transaction,
+		// so blob garbage collection never sees the new blob without its card
+		const newCardId = await transaction(async (tx) => {
+			const final_front_content = await storeCardContent(tx.run, tx.get, encodedFront);
+			const final_back_content = await storeCardContent(tx.run, tx.get, encodedBack);
+			const result = await tx.run(`
+				INSERT INTO cards 
+				(deck_id, front_type, front_content, back_type, back_content, due_date, due, interval, ease_factor)
+				VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+			`, [
+				deckId,
+				front_type, final_front_content,
+				back_type, final_back_content,
+				initialDueDate, initialDue, initialInterval, initialEaseFactor
+			]);
+			return result.lastID;
+		});
 
-		console.log(`Added card with ID ${newCardId} to deck '${deckName}' (ID: ${deckId})`);
+		logger.debug(`Added card with ID ${newCardId} to deck '${deckName}' (ID: ${deckId})`);
 
 		// 5. Retrieve and return the newly created card
 		const newCard = await get(`SELECT * FROM cards WHERE id = ?`, [newCardId]);
@@ -438,7 +598,7 @@ app.post('/api/decks/:deckName/cards', async (req, res) => {
 		res.status(201).json(newCard);
 
 	} catch (error) {
-		console.error(`Error adding card to deck '${deckName}':`, error.message);
+		logger.error(`Error adding card to deck '${deckName}':`, error.message);
 		res.status(500).json({ message: "Error adding card", error: error.message });
 	}
 });
@@ -449,7 +609,7 @@ app.post('/api/decks/:deckName/cards/:cardId/rate', async (req, res) => {
 	const { quality, timeTakenMs } = req.body;
 	const cardId = parseInt(cardIdString, 10);
 
-	console.log(`POST /api/decks/${deckName}/cards/${cardId}/rate request received with quality ${quality}, time: ${timeTakenMs}`);
+	logger.debug(`POST /api/decks/${deckName}/cards/${cardId}/rate request received with quality ${quality}, time: ${timeTakenMs}`);
 
 	// Validate input
 	if (quality === undefined || typeof quality !== 'number' || quality < 0 || quality > 3) {
@@ -460,68 +620,175 @@ app.post('/api/decks/:deckName/cards/:cardId/rate', async (req, res) => {
 	}
 
 	try {
-		// 1. Get the current card data from DB to get last interval etc.
-		const currentCard = await get(`SELECT * FROM cards WHERE id = ?`, [cardId]);
-		if (!currentCard) {
+		// Read, reschedule and write inside one transaction, so a concurrent rating of the
+		// same card cannot compute from the same old interval and overwrite this one.
+		const rated = await transaction(async (tx) => {
+			// 1. Get the current card data from DB to get last interval etc.
+			const currentCard = await tx.get(`SELECT * FROM cards WHERE id = ?`, [cardId]);
+			if (!currentCard) {
+				return false;
+			}
+			const lastInterval = currentCard.interval; // Store before modification
+
+			// 2. Calculate the new schedule using the helper function
+			// Make a copy to update, so we have original for logging
+			const cardToUpdate = { ...currentCard };
+			updateCardSchedule(cardToUpdate, quality);
+
+			// 3. Update the card and record the review (with time_taken)
+			const updateResult = await tx.run(`
+				UPDATE cards 
+				SET due_date = ?, due = ?, interval = ?, ease_factor = ?, mod = strftime('%s', 'now')
+				WHERE id = ?
+			`, [cardToUpdate.due_date, cardToUpdate.due, cardToUpdate.interval, cardToUpdate.ease_factor, cardId]);
+			if (updateResult.changes === 0) {
+				throw new Error("Card update failed, no rows affected.");
+			}
+			await tx.run(`
+				INSERT INTO revlog (card_id, review_time, quality, last_interval, new_interval, new_ease_factor, time_taken)
+				VALUES (?, ?, ?, ?, ?, ?, ?)
+			`, [
+				cardId,
+				new Date().toISOString(),
+				quality,
+				lastInterval,
+				cardToUpdate.interval,
+				cardToUpdate.ease_factor,
+				timeTakenMs // Add time_taken value here
+			]);
+			return true;
+		});
+		if (!rated) {
 			return res.status(404).json({ error: `Card with ID ${cardId} not found.` });
 		}
-		const lastInterval = currentCard.interval; // Store before modification
-
-		// 2. Calculate the new schedule using the helper function
-		// Make a copy to update, so we have original for logging
-		const cardToUpdate = { ...currentCard };
-		updateCardSchedule(cardToUpdate, quality);
-		const newInterval = cardToUpdate.interval;
-		const newEaseFactor = cardToUpdate.ease_factor;
-		const newDueDate = cardToUpdate.due_date;
-
-		// 3. Update the card in the database
-		const updateQuery = `
-			UPDATE cards 
-			SET due_date = ?, interval = ?, ease_factor = ?, mod = strftime('%s', 'now')
-			WHERE id = ?
-		`;
-		const updateParams = [newDueDate, newInterval, newEaseFactor, cardId];
-		const updateResult = await run(updateQuery, updateParams);
-		if (updateResult.changes === 0) {
-			throw new Error("Card update failed, no rows affected.");
-		}
-		console.log(`Successfully updated schedule for card ID ${cardId}`);
-
-		// 4. Record review in revlog table, including time_taken
-		const reviewTime = new Date().toISOString();
-		const revlogQuery = `
-			INSERT INTO revlog (card_id, review_time, quality, last_interval, new_interval, new_ease_factor, time_taken)
-			VALUES (?, ?, ?, ?, ?, ?, ?)
-		`;
-		const revlogParams = [
-			cardId,
-			reviewTime,
-			quality,
-			lastInterval,
-			newInterval,
-			newEaseFactor,
-			timeTakenMs // Add time_taken value here
-		];
-		await run(revlogQuery, revlogParams);
-		console.log(`Recorded review for card ID ${cardId} in revlog (time: ${timeTakenMs}ms).`);
-
-		// 5. Send success response 
+		logger.debug(`Updated schedule for card ID ${cardId} and recorded review in revlog (time: ${timeTakenMs}ms).`);
+
+		// 4. Send success response 
 		res.status(200).json({ message: "Card rated successfully" });
 
 	} catch (error) {
-		console.error(`Error rating card ${cardId} in deck ${deckName}:`, error.message);
+		logger.error(`Error rating card ${cardId} in deck ${deckName}:`, error.message);
 		res.status(500).json({ message: "Error rating card", error: error.message });
 	}
 });
 
+// Maximum number of ratings accepted in a single batch request
+const MAX_RATING_BATCH_SIZE = 500;
+
+// Rate many cards at once (used by the frontend's offline-safe rating queue).
+// Body: { ratings: [{ cardId, quality, timeTakenMs, reviewedAt }] }
+// All card updates and revlog rows are written in one transaction. A rating whose
+// (cardId, reviewedAt) pair is already in revlog is skipped, so clients can safely
+// resend a batch whose response they never received.
+app.post('/api/decks/:deckName/cards/rate-batch', async (req, res) => {
+	const { deckName } = req.params;
+	const { ratings } = req.body;
+	logger.debug(`POST /api/decks/${deckName}/cards/rate-batch request received with ${Array.isArray(ratings) ? ratings.length : 0} ratings`);
+
+	// Validate input
+	if (!Array.isArray(ratings) || ratings.length === 0) {
+		return res.status(400).json({ error: 'Missing or empty ratings array.' });
+	}
+	if (ratings.length > MAX_RATING_BATCH_SIZE) {
+		return res.status(400).json({ error: `Too many ratings. At most ${MAX_RATING_BATCH_SIZE} per batch.` });
+	}
+	const reviews = [];
+	for (const rating of ratings) {
+		const cardId = parseInt(rating?.cardId, 10);
+		const { quality, timeTakenMs } = rating || {};
+		const reviewedAt = rating?.reviewedAt === undefined ? new Date() : new Date(rating.reviewedAt);
+		if (isNaN(cardId)) {
+			return res.status(400).json({ error: 'Invalid card ID in ratings.' });
+		}
+		if (typeof quality !== 'number' || quality < 0 || quality > 3) {
+			return res.status(400).json({ error: `Invalid quality value for card ${cardId}. Must be a number between 0 and 3.` });
+		}
+		if (isNaN(reviewedAt.getTime())) {
+			return res.status(400).json({ error: `Invalid reviewedAt for card ${cardId}.` });
+		}
+		reviews.push({
+			cardId,
+			quality,
+			timeTakenMs: typeof timeTakenMs === 'number' ? timeTakenMs : null,
+			reviewedAt
+		});
+	}
+	// Apply in review order so repeated ratings of one card (e.g. Again, then Good) chain correctly
+	reviews.sort((a, b) => a.reviewedAt - b.reviewedAt);
+
+	try {
+		// 1. Find the deck ID
+		const deck = await get(`SELECT id FROM decks WHERE name = ?`, [deckName]);
+		if (!deck) {
+			return res.status(404).json({ error: `Deck '${deckName}' not found` });
+		}
+
+		// 2. Load the cards and write all schedules and revlog entries in a single transaction.
+		// The cards are read inside it, so overlapping batches or single ratings of the same
+		// card are applied one after the other instead of both starting from the old schedule.
+		const summary = await transaction(async (tx) => {
+			const cardIds = [...new Set(reviews.map(r => r.cardId))];
+			const rows = await tx.all(
+				`SELECT id, interval, ease_factor FROM cards WHERE deck_id = ? AND id IN (SELECT value FROM json_each(?))`,
+				[deck.id, JSON.stringify(cardIds)]
+			);
+			const cardsById = new Map(rows.map(row => [row.id, row]));
+
+			const applied = [];
+			const duplicates = [];
+			const notFound = [];
+			for (const review of reviews) {
+				const card = cardsById.get(review.cardId);
+				if (!card) {
+					notFound.push(review.cardId);
+					continue;
+				}
+				const reviewTime = review.reviewedAt.toISOString();
+				if (await tx.get(`SELECT 1 FROM revlog WHERE card_id = ? AND review_time = ?`, [review.cardId, reviewTime])) {
+					duplicates.push(review.cardId);
+					continue;
+				}
+				const lastInterval = card.interval;
+				updateCardSchedule(card, review.quality, review.reviewedAt);
+				await tx.run(`
+					UPDATE cards 
+					SET due_date = ?, due = ?, interval = ?, ease_factor = ?, mod = strftime('%s', 'now')
+					WHERE id = ?
+				`, [card.due_date, card.due, card.interval, card.ease_factor, card.id]);
+				await tx.run(`
+					INSERT INTO revlog (card_id, review_time, quality, last_interval, new_interval, new_ease_factor, time_taken)
+					VALUES (?, ?, ?, ?, ?, ?, ?)
+				`, [
+					card.id, reviewTime, review.quality,
+					lastInterval, card.interval, card.ease_factor,
+					review.timeTakenMs
+				]);
+				applied.push(review.cardId);
+			}
+			return { applied, duplicates, notFound };
+		});
+
+		logger.debug(`Applied ${summary.applied.length} ratings in deck '${deckName}' (${summary.duplicates.length} duplicates, ${summary.notFound.length} missing cards).`);
+		res.status(200).json({
+			message: "Cards rated successfully",
+			applied: summary.applied.length,
+			duplicates: summary.duplicates,
+			notFound: summary.notFound
+		});
+
+	} catch (error) {
+		logger.error(`Error rating batch in deck ${deckName}:`, error.message);
+		res.status(500).json({ message: "Error rating cards", error: error.message });
+	}
+});
+
 // Update card content (refactored for SQLite)
 app.patch('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 	const { deckName, cardId: cardIdString } = req.params;
 	const { side, newContent } = req.body; // side: 'front' | 'back'
 	const cardId = parseInt(cardIdString, 10); // Assume IDs are numbers from DB
 
-	console.log(`PATCH /api/decks/${deckName}/cards/${cardId} request received for side: ${side}`);
+	logger.debug(`PATCH /api/decks/${deckName}/cards/${cardId} request received for side: ${side}`);
 
 	// Validate input
 	if (!side || newContent === undefined || newContent === null) { // Allow empty string for content
@@ -535,53 +802,57 @@ app.patch('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 	}
 
 	try {
-		// 1. Get the current card data to check its type
-		const cardToUpdate = await get(`SELECT id, front_type, back_type, deck_id FROM cards WHERE id = ?`, [cardId]);
+		const typeKey = side === 'front' ? 'front_type' : 'back_type';
+		const updateKey = side === 'front' ? 'front_content' : 'back_content';
 
-		if (!cardToUpdate) {
+		// 1. Get the card's content type (types never change after creation)
+		const card = await get(`SELECT ${typeKey}, deck_id FROM cards WHERE id = ?`, [cardId]);
+		if (!card) {
 			return res.status(404).json({ error: `Card with ID ${cardId} not found.` });
 		}
 
 		// Optional: Verify deck name?
 		// const deck = await get(`SELECT id FROM decks WHERE name = ?`, [deckName]);
-		// if (!deck || deck.id !== cardToUpdate.deck_id) { ... }
-
-		// 2. Prepare content (minify Excalidraw)
-		const typeKey = side === 'front' ? 'front_type' : 'back_type';
-		const updateKey = side === 'front' ? 'front_content' : 'back_content';
-		let contentToSave = newContent;
-
-		if (cardToUpdate[typeKey] === 'excalidraw') {
-			try {
-				const parsed = JSON.parse(newContent);
-				contentToSave = JSON.stringify(parsed); // Minified
-				console.log(`Minified Excalidraw content for card ${cardId}, side ${side}.`);
-			} catch (e) {
-				console.warn(`Failed to parse/minify Excalidraw content for card ${cardId}, side ${side}. Saving as is. Error: ${e.message}`);
-				contentToSave = newContent; // Save original if parse fails
+		// if (!deck || deck.id !== card.deck_id) { ... }
+
+		// 2. Prepare content (minify Excalidraw and compress it) before taking the writer
+		const encoded = await encodeCardContent(get, card[typeKey], newContent);
+
+		// Store the new drawing, update and drop the replaced drawing in one transaction
+		const updated = await transaction(async (tx) => {
+			const cardToUpdate = await tx.get(
+				`SELECT id, ${typeKey}, ${updateKey} FROM cards WHERE id = ?`,
+				[cardId]
+			);
+			if (!cardToUpdate) {
+				return false; // Deleted meanwhile
+			}
+			const contentToSave = await storeCardContent(tx.run, tx.get, encoded);
+
+			// 3. Update the card content and modification time in the database
+			const result = await tx.run(`
+				UPDATE cards 
+				SET 
+					${updateKey} = ?,
+					mod = strftime('%s', 'now')
+				WHERE id = ?
+			`, [contentToSave, cardId]);
+			if (result.changes === 0) {
+				// Should not happen if the card was found earlier
+				throw new Error("Card update failed, no rows affected.");
 			}
-		}
-
-		// 3. Update the card content and modification time in the database
-		const updateQuery = `
-			UPDATE cards 
-			SET 
-				${updateKey} = ?,
-				mod = strftime('%s', 'now')
-			WHERE id = ?
-		`;
-		const updateParams = [contentToSave, cardId];
-
-		const result = await run(updateQuery, updateParams);
 
-		if (result.changes === 0) {
-			// Should not happen if the card was found earlier
-			throw new Error("Card update failed, no rows affected.");
+			// 4. Drop the previous drawing unless another card still uses it
+			await collectBlobGarbage(tx.run, cardBlobHashes(cardToUpdate));
+			return true;
+		});
+		if (!updated) {
+			return res.status(404).json({ error: `Card with ID ${cardId} not found.` });
 		}
 
-		console.log(`Successfully updated ${updateKey} for card ID ${cardId}`);
+		logger.debug(`Successfully updated ${updateKey} for card ID ${cardId}`);
 
-		// 4. Retrieve and return the full updated card
+		// 5. Retrieve and return the full updated card
 		const updatedCard = await get(`SELECT * FROM cards WHERE id = ?`, [cardId]);
 		if (!updatedCard) {
 			throw new Error("Failed to retrieve updated card data after update.");
@@ -589,7 +860,7 @@ app.patch('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 		res.status(200).json(updatedCard);
 
 	} catch (error) {
-		console.error(`Error updating content for card ${cardId}:`, error.message);
+		logger.error(`Error updating content for card ${cardId}:`, error.message);
 		res.status(500).json({ message: "Error updating card content", error: error.message });
 	}
 });
@@ -598,7 +869,7 @@ app.patch('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 app.delete('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 	const { deckName, cardId: cardIdString } = req.params;
 	const cardId = parseInt(cardIdString, 10);
-	console.log(`DELETE /api/decks/${deckName}/cards/${cardId} request received`);
+	logger.debug(`DELETE /api/decks/${deckName}/cards/${cardId} request received`);
 
 	if (isNaN(cardId)) {
 		return res.status(400).json({ error: 'Invalid card ID.' });
@@ -622,19 +893,30 @@ app.delete('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 			return res.status(404).json({ error: `Card with ID ${cardId} not found in deck '${deckName}'.` });
 		}
 
-		// 2. Delete the card
-		const result = await run(
-			`DELETE FROM cards WHERE id = ?`,
-			[cardId]
-		);
-		if (result.changes === 0) {
-			throw new Error('Card deletion failed, no rows affected.');
-		}
+		// 2. Delete the card and any drawing no other card shares
+		await transaction(async (tx) => {
+			const drawings = await tx.get(
+				`SELECT front_type, front_content, back_type, back_content FROM cards WHERE id = ?`,
+				[cardId]
+			);
+			const result = await tx.run(
+				`DELETE FROM cards WHERE id = ?`,
+				[cardId]
+			);
+			if (result.changes === 0) {
+				throw new Error('Card deletion failed, no rows affected.');
+			}
+			await collectBlobGarbage(tx.run, cardBlobHashes(drawings));
+		});
+
+		logger.debug(`Successfully deleted card ID ${cardId} from deck '${deckName}'.`);
+
+		// 3. Delete media files only this card was using
+		await media.collectMediaGarbage(db, MEDIA_DIR);
 
-		console.log(`Successfully deleted card ID ${cardId} from deck '${deckName}'.`);
 		res.status(200).json({ message: `Card ${cardId} deleted successfully.` });
 	} catch (error) {
-		console.error(`Error deleting card ${cardId} in deck '${deckName}':`, error.message);
+		logger.error(`Error deleting card ${cardId} in deck '${deckName}':`, error.message);
 		res.status(500).json({ message: 'Error deleting card', error: error.message });
 	}
 });
@@ -642,7 +924,7 @@ app.delete('/api/decks/:deckName/cards/:cardId', async (req, res) => {
 // Delete a deck (refactored for SQLite)
 app.delete('/api/decks/:deckName', async (req, res) => {
 	const { deckName } = req.params;
-	console.log(`DELETE /api/decks/${deckName} request received`);
+	logger.debug(`DELETE /api/decks/${deckName} request received`);
 
 	if (deckName === 'Default') {
 		return res.status(400).json({ error: "Cannot delete the 'Default' deck" });
@@ -667,45 +949,109 @@ app.delete('/api/decks/:deckName', async (req, res) => {
 			throw new Error("Deck deletion failed, no rows affected.");
 		}
 
-		console.log(`Successfully deleted deck '${deckName}' (ID: ${deckId}) and its cards.`);
+		logger.debug(`Successfully deleted deck '${deckName}' (ID: ${deckId}) and its cards.`);
+
+		// 3. Drop drawings no other card shares
+		const removedBlobs = await collectBlobGarbage(run);
+		logger.debug(`Removed ${removedBlobs} unreferenced blobs.`);
 
-		// 3. TODO: Delete associated media files? (More complex)
+		// 4. Delete media files the deck's cards were the last users of
+		const removedMedia = await media.collectMediaGarbage(db, MEDIA_DIR);
+		logger.debug(`Removed ${removedMedia} unreferenced media files.`);
 
-		// 4. Send success response
+		// 5. Send success response
 		res.status(200).json({ message: `Deck '${deckName}' deleted successfully` });
 
 	} catch (error) {
-		console.error(`Error deleting deck '${deckName}':`, error.message);
+		logger.error(`Error deleting deck '${deckName}':`, error.message);
 		res.status(500).json({ message: "Error deleting deck", error: error.message });
 	}
 });
 
-// File Upload Endpoint
-// ... (rest of the POST /api/upload endpoint code) ...
+// Serve a stored blob (Excalidraw scene) by hash.
+// Blobs are immutable, so the hash (plus the content encoding, since each encoding is different
+// bytes) serves as a strong ETag and the response can be cached forever.
+// The stored brotli/gzip bytes are sent as-is when the client accepts them.
+app.get('/api/blobs/:hash', async (req, res) => {
+	const { hash } = req.params;
+	if (!BLOB_HASH_PATTERN.test(hash)) {
+		return res.status(400).json({ error: 'Invalid blob hash.' });
+	}
+
+	const encoding = req.acceptsEncodings('br', 'gzip', 'identity');
+	const etag = encoding === 'br' || encoding === 'gzip' ? `"${hash}-${encoding}"` : `"${hash}"`;
+	res.setHeader('ETag', etag);
+	res.setHeader('Cache-Control', 'public, max-age=31536000, immutable');
+	res.setHeader('Vary', 'Accept-Encoding');
+	const ifNoneMatch = req.headers['if-none-match'];
+	if (ifNoneMatch && ifNoneMatch.split(',').some(tag => tag.trim() === etag)) {
+		return res.status(304).end();
+	}
 
-// Get review statistics (refactored for SQLite)
-app.get('/api/stats', async (req, res) => {
-	console.log('GET /api/stats request received');
 	try {
-		// --- Aggregated Stats ---
+		let body;
+		if (encoding === 'br' || encoding === 'gzip') {
+			const row = await get(`SELECT ${encoding} AS data FROM blobs WHERE hash = ?`, [hash]);
+			body = row && row.data;
+			if (body) res.setHeader('Content-Encoding', encoding);
+		} else {
+			const content = await loadBlob(get, hash);
+			body = content === null ? null : Buffer.from(content, 'utf8');
+		}
+		if (!body) {
+			res.removeHeader('Cache-Control');
+			return res.status(404).json({ error: `Blob '${hash}' not found` });
+		}
+		res.setHeader('Content-Type', 'application/json; charset=utf-8');
+		res.setHeader('Content-Length', body.length);
+		res.end(body);
 
-		// 1. Reviews in the last 7 days
-		const reviewsLast7DaysResult = await get(
-			`SELECT COUNT(*) as count FROM revlog WHERE date(review_time) >= date('now', '-7 days')`
-		);
-		const reviewsLast7Days = reviewsLast7DaysResult.count || 0;
+	} catch (error) {
+		logger.error(`Error loading blob '${hash}':`, error.message);
+		res.removeHeader('Cache-Control');
+		res.status(500).json({ message: "Error loading blob", error: error.message });
+	}
+});
 
-		// 2. Total reviews
-		const totalReviewsResult = await get(
-			`SELECT COUNT(*) as count FROM revlog`
-		);
-		const totalReviews = totalReviewsResult.count || 0;
+// File Upload Endpoint
+app.post('/api/upload', upload.single('imageFile'), (req, res) => {
+	logger.debug('POST /api/upload request received');
+	if (req.fileValidationError) {
+		return res.status(400).json({ error: req.fileValidationError });
+	}
+	if (!req.file) {
+		return res.status(400).json({ error: "No file uploaded (expected field 'imageFile')" });
+	}
 
-		// 3. Average time taken (optional, requires time_taken to be populated)
-		const avgTimeResult = await get(
-			`SELECT AVG(time_taken) as avg_ms FROM revlog WHERE time_taken IS NOT NULL AND time_taken > 0`
-		);
-		const averageTimeSec = avgTimeResult.avg_ms ? (avgTimeResult.avg_ms / 1000).toFixed(1) : null;
+	// The storage engine has already registered the file for garbage collection.
+	// Render thumbnail/display variants in the background.
+	if (!req.file.duplicate) {
+		media.scheduleVariants(MEDIA_DIR, req.file);
+	}
+
+	logger.debug(`Stored upload as ${req.file.filename}${req.file.duplicate ? ' (duplicate)' : ''}.`);
+	res.status(201).json({ filename: req.file.filename });
+});
+
+// Get review statistics (refactored for SQLite)
+app.get('/api/stats', async (req, res) => {
+	logger.debug('GET /api/stats request received');
+	try {
+		// --- Aggregated Stats (from the daily revlog rollup) ---
+		const summaryResult = await get(`
+			SELECT
+				SUM(CASE WHEN day >= date('now', '-7 days') THEN reviews ELSE 0 END) as reviews_last_7_days,
+				SUM(reviews) as total_reviews,
+				SUM(time_sum) as time_sum,
+				SUM(timed_reviews) as timed_reviews
+			FROM revlog_daily
+		`);
+		const reviewsLast7Days = summaryResult.reviews_last_7_days || 0;
+		const totalReviews = summaryResult.total_reviews || 0;
+		// Average time taken (only over reviews with time_taken recorded)
+		const averageTimeSec = summaryResult.timed_reviews
+			? (summaryResult.time_sum / summaryResult.timed_reviews / 1000).toFixed(1)
+			: null;
 
 		// --- Raw Recent Logs (Optional - keep for detailed view?) ---
 		const recentLogsQuery = `
@@ -744,12 +1090,29 @@ app.get('/api/stats', async (req, res) => {
 		});
 
 	} catch (error) {
-		console.error("Error loading stats from DB:", error.message);
+		logger.error("Error loading stats from DB:", error.message);
 		res.status(500).json({ message: "Error loading statistics", error: error.message });
 	}
 });
 
-// SSE stream endpoint for AI definitions
+// --- AI Definitions ---
+const safetySettings = [
+	{ category: HarmCategory.HARM_CATEGORY_HARASSMENT, threshold: HarmBlockThreshold.BLOCK_NONE },
+	{ category: HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold: HarmBlockThreshold.BLOCK_NONE },
+	{ category: HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold: HarmBlockThreshold.BLOCK_NONE },
+	{ category: HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold: HarmBlockThreshold.BLOCK_NONE },
+];
+const definitionsService = aiDefinitions.createDefinitionsService({
+	db,
+	backend: AI_BACKEND === 'stub'
+		? aiDefinitions.stubBackend()
+		: aiDefinitions.geminiBackend({ apiKey: process.env.GOOGLE_API_KEY, safetySettings }),
+	ttlSeconds: AI_CACHE_TTL_SECONDS
+});
+
+// SSE stream endpoint for AI definitions.
+// Each definition is sent as soon as it has been parsed from the upstream stream;
+// results are cached per deck, and concurrent requests share one upstream call.
 app.get('/api/decks/:deckName/ai-definitions-stream', async (req, res) => {
 	const { deckName } = req.params;
 	// Set SSE headers
@@ -758,90 +1121,140 @@ app.get('/api/decks/:deckName/ai-definitions-stream', async (req, res) => {
 	res.setHeader('Connection', 'keep-alive');
 	res.flushHeaders();
 
-	const prompt = `Сгенерируйте 5 кратких технически точных определений простыми словами, ключевых терминов для темы "${deckName}", без аналогий. Верните результат в виде JSON-массива. На русском языке.`;
 	try {
-		// Use Cloudflare Worker proxy for Gemini API
-		const API_KEY = process.env.GOOGLE_API_KEY;
-		const WORKER_URL = `https://gemini-proxy.sezoran01.workers.dev/v1beta/models/gemini-2.0-flash:generateContent?key=${API_KEY}`;
-		const requestBody = {
-			contents: [{ parts: [{ text: prompt }] }],
-			generationConfig: { temperature: 0.1, topP: 0.95, topK: 0 },
-			safetySettings
-		};
-		const response = await fetch(WORKER_URL, {
-			method: 'POST', headers: { 'Content-Type': 'application/json' },
-			body: JSON.stringify(requestBody)
-		});
-		if (!response.ok) {
-			const errorText = await response.text();
-			throw new Error(`API request failed with status ${response.status}: ${errorText}`);
-		}
-		const resultJson = await response.json();
-		const aiText = resultJson?.candidates?.[0]?.content?.parts?.[0]?.text || '';
-
-		// Parse definitions array from aiText
-		let definitions;
-		try {
-			definitions = JSON.parse(aiText);
-		} catch {
-			const start = aiText.indexOf('[');
-			const end = aiText.lastIndexOf(']');
-			if (start !== -1 && end !== -1) {
-				try { definitions = JSON.parse(aiText.slice(start, end + 1)); }
-				catch { definitions = aiText.slice(start + 1, end).split(/\r?\n/).map(l => l.trim()).filter(Boolean); }
-			} else {
-				definitions = aiText.split(/\r?\n/).map(l => l.trim()).filter(Boolean);
+		const unsubscribe = await definitionsService.subscribe(deckName, {
+			// Stream each definition as its own SSE event
+			onDefinition: (def) => res.write(`data: ${JSON.stringify(def)}\n\n`),
+			// Signal end of stream
+			onEnd: () => {
+				res.write('event: end\ndata: done\n\n');
+				res.end();
+			},
+			onError: (error) => {
+				logger.error("Error in AI definitions stream:", error);
+				res.write(`event: error\ndata: ${JSON.stringify(error.message || 'Unknown error occurred')}\n\n`);
+				res.end();
 			}
-		}
-		// Stream each definition as its own SSE event
-		for (const def of definitions) {
-			res.write(`data: ${JSON.stringify(def)}\n\n`);
-		}
-		// Signal end of stream
-		res.write('event: end\ndata: done\n\n');
+		});
+		// The upstream call keeps going for other subscribers (and the cache) if this client leaves
+		req.on('close', unsubscribe);
 	} catch (error) {
-		console.error("Error in AI definitions stream:", error);
+		logger.error("Error in AI definitions stream:", error);
 		// Send error to client via SSE
 		res.write(`event: error\ndata: ${JSON.stringify(error.message || 'Unknown error occurred')}\n\n`);
-	} finally {
 		res.end();
 	}
 });
 
+// Bulk import (CSV, Anki-style TSV or legacy JSON). The body is parsed as it arrives and
+// inserted in chunked transactions. Progress is streamed back as NDJSON lines; the last line
+// is the summary ({ done: true, ... }) or { error }.
+app.post('/api/import', async (req, res) => {
+	const format = req.query.format || bulk.detectFormat(req.get('Content-Type'));
+	const deckName = typeof req.query.deck === 'string' && req.query.deck.trim() ? req.query.deck.trim() : 'Default';
+	logger.debug(`POST /api/import request received (format: ${format}, deck: ${deckName})`);
+
+	if (!bulk.FORMATS[format]) {
+		return res.status(400).json({ error: `Invalid format. Use one of: ${Object.keys(bulk.FORMATS).join(', ')}` });
+	}
+
+	// Headers are sent with the first progress line, so errors before that still get a 400
+	const sendLine = (data) => {
+		if (!res.headersSent) res.setHeader('Content-Type', 'application/x-ndjson; charset=utf-8');
+		res.write(JSON.stringify(data) + '\n');
+	};
+
+	try {
+		const summary = await bulk.importCards(db, req, {
+			format,
+			deck: deckName,
+			onProgress: progress => sendLine(progress)
+		});
+		logger.info(`Imported ${summary.imported} cards (${summary.skipped} skipped) into ${summary.decks.length} decks.`);
+		sendLine({ done: true, ...summary });
+		res.end();
+	} catch (error) {
+		logger.error('Error importing cards:', error.message);
+		if (!res.headersSent) {
+			return res.status(400).json({ message: "Error importing cards", error: error.message });
+		}
+		sendLine({ error: error.message });
+		res.end();
+	}
+});
+
+// Streaming export of a deck (csv, tsv or json), for backups and moving decks between installs
+app.get('/api/decks/:deckName/export', async (req, res) => {
+	const { deckName } = req.params;
+	const format = req.query.format || 'json';
+	logger.debug(`GET /api/decks/${deckName}/export request received (format: ${format})`);
+
+	if (!bulk.FORMATS[format]) {
+		return res.status(400).json({ error: `Invalid format. Use one of: ${Object.keys(bulk.FORMATS).join(', ')}` });
+	}
+
+	// Write a chunk, waiting for the socket to drain before reading more cards
+	const write = (text) => {
+		if (!res.headersSent) {
+			res.setHeader('Content-Type', bulk.FORMATS[format].contentType);
+			res.attachment(`${deckName}${bulk.FORMATS[format].extension}`);
+		}
+		if (res.destroyed) throw new Error('Client closed the connection');
+		if (res.write(text)) return;
+		return waitForDrain(res);
+	};
+
+	try {
+		const count = await bulk.exportDeck(db, deckName, format, write);
+		if (count === null) {
+			return res.status(404).json({ error: `Deck '${deckName}' not found` });
+		}
+		res.end();
+		logger.debug(`Exported ${count} cards from deck '${deckName}'`);
+	} catch (error) {
+		logger.error(`Error exporting deck '${deckName}':`, error.message);
+		if (res.headersSent) {
+			return res.destroy(error);
+		}
+		if (error.code === 'UNSUPPORTED_CONTENT') {
+			return res.status(400).json({ error: error.message });
+		}
+		res.status(500).json({ message: "Error exporting deck", error: error.message });
+	}
+});
+
+// Performance metrics in Prometheus text format (route latency, SQL timings, event-loop lag)
+app.get('/metrics', (req, res) => {
+	res.set('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+	res.set('Cache-Control', 'no-store');
+	res.send(metrics.render());
+});
+
 // --- Start Server ---
 app.listen(PORT, () => {
-	console.log(`Backend server running on http://localhost:${PORT}`);
+	logger.info(`Backend server running on http://localhost:${PORT}`);
 	// Removed directory verification logic as it was tied to JSON files
 });
 
+// Periodically delete uploads that no card references (after a grace period)
+setInterval(() => {
+	media.collectMediaGarbage(db, MEDIA_DIR)
+		.then(removed => removed > 0 && logger.info(`Removed ${removed} unreferenced media files.`))
+		.catch(err => logger.error('Media garbage collection failed:', err.message));
+}, 60 * 60 * 1000).unref();
+
 // Graceful shutdown
 process.on('SIGINT', () => {
-	db.close((err) => {
-		if (err) {
-			return console.error(err.message);
-		}
-		console.log('Closed the database connection.');
-		process.exit(0);
-	});
+	db.close()
+		.then(() => {
+			logger.info('Closed the database connections.');
+			process.exit(0);
+		})
+		.catch((err) => logger.error(err.message));
 });
 
-// Validate Gemini API key
-if (!process.env.GOOGLE_API_KEY) {
-	console.error("Error: GOOGLE_API_KEY is not set in environment variables.");
+// Validate Gemini API key (not needed with the local stub backend)
+if (AI_BACKEND !== 'stub' && !process.env.GOOGLE_API_KEY) {
+	logger.error("Error: GOOGLE_API_KEY is not set in environment variables.");
 	process.exit(1);
 }
-// Initialize Gemini AI model
-const genAI = new GoogleGenerativeAI(process.env.GOOGLE_API_KEY);
-const safetySettings = [
-	{ category: HarmCategory.HARM_CATEGORY_HARASSMENT, threshold: HarmBlockThreshold.BLOCK_NONE },
-	{ category: HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold: HarmBlockThreshold.BLOCK_NONE },
-	{ category: HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold: HarmBlockThreshold.BLOCK_NONE },
-	{ category: HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold: HarmBlockThreshold.BLOCK_NONE },
-];
-const aiModel = genAI.getGenerativeModel({
-	model: 'gemini-2.0-flash',
-	temperature: 0.1,
-	topP: 0.95,
-	topK: 0,
-	safetySettings
-});
\ No newline at end of file
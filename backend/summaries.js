@@ -0,0 +1,129 @@
+// Materialized summary tables for the deck list and the stats page.
+//
+// - deck_due_counts: number of cards (and "new" cards, interval <= 1) per deck per due day.
+//   Deck totals and due/new counts are sums over a handful of rows instead of a scan of 'cards'.
+// - revlog_daily: per-day review counts, answer-time sums and quality histograms.
+//
+// Both are kept up to date by triggers, so every write path (single ratings, batches,
+// card adds/deletes) updates them in the same transaction as the change itself.
+
+const { logger } = require('./logger');
+
+const SECONDS_PER_DAY = 86400;
+
+const SUMMARY_TABLES = [
+	`CREATE TABLE IF NOT EXISTS deck_due_counts (
+		deck_id INTEGER NOT NULL,
+		due_day INTEGER NOT NULL,            -- 'due' / 86400 (days since unix epoch, UTC)
+		cards INTEGER NOT NULL DEFAULT 0,
+		new_cards INTEGER NOT NULL DEFAULT 0, -- cards with interval <= 1
+		PRIMARY KEY (deck_id, due_day)
+	) WITHOUT ROWID`,
+	`CREATE TABLE IF NOT EXISTS revlog_daily (
+		day TEXT PRIMARY KEY,                -- 'YYYY-MM-DD' of review_time
+		reviews INTEGER NOT NULL DEFAULT 0,
+		time_sum INTEGER NOT NULL DEFAULT 0, -- Sum of time_taken (ms) over timed reviews
+		timed_reviews INTEGER NOT NULL DEFAULT 0,
+		again INTEGER NOT NULL DEFAULT 0,
+		hard INTEGER NOT NULL DEFAULT 0,
+		good INTEGER NOT NULL DEFAULT 0,
+		easy INTEGER NOT NULL DEFAULT 0
+	) WITHOUT ROWID`
+];
+
+// Trigger bodies shared by the card triggers below
+const addCardCount = (row) => `
+	INSERT INTO deck_due_counts (deck_id, due_day, cards, new_cards)
+	VALUES (${row}.deck_id, ${row}.due / ${SECONDS_PER_DAY}, 1, ${row}.interval <= 1)
+	ON CONFLICT (deck_id, due_day) DO UPDATE SET
+		cards = cards + 1,
+		new_cards = new_cards + (${row}.interval <= 1);`;
+
+const removeCardCount = (row) => `
+	UPDATE deck_due_counts SET
+		cards = cards - 1,
+		new_cards = new_cards - (${row}.interval <= 1)
+	WHERE deck_id = ${row}.deck_id AND due_day = ${row}.due / ${SECONDS_PER_DAY};
+	DELETE FROM deck_due_counts
+	WHERE deck_id = ${row}.deck_id AND due_day = ${row}.due / ${SECONDS_PER_DAY} AND cards <= 0;`;
+
+const SUMMARY_TRIGGERS = [
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_insert_counts AFTER INSERT ON cards BEGIN
+		${addCardCount('NEW')}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_delete_counts AFTER DELETE ON cards BEGIN
+		${removeCardCount('OLD')}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_cards_update_counts AFTER UPDATE OF deck_id, due, interval ON cards BEGIN
+		${removeCardCount('OLD')}
+		${addCardCount('NEW')}
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_decks_delete_counts AFTER DELETE ON decks BEGIN
+		DELETE FROM deck_due_counts WHERE deck_id = OLD.id;
+	END`,
+	`CREATE TRIGGER IF NOT EXISTS trg_revlog_insert_daily AFTER INSERT ON revlog BEGIN
+		INSERT INTO revlog_daily (day, reviews, time_sum, timed_reviews, again, hard, good, easy)
+		VALUES (
+			date(NEW.review_time), 1,
+			CASE WHEN NEW.time_taken > 0 THEN NEW.time_taken ELSE 0 END,
+			CASE WHEN NEW.time_taken > 0 THEN 1 ELSE 0 END,
+			NEW.quality = 0, NEW.quality = 1, NEW.quality = 2, NEW.quality = 3
+		)
+		ON CONFLICT (day) DO UPDATE SET
+			reviews = reviews + 1,
+			time_sum = time_sum + excluded.time_sum,
+			timed_reviews = timed_reviews + excluded.timed_reviews,
+			again = again + excluded.again,
+			hard = hard + excluded.hard,
+			good = good + excluded.good,
+			easy = easy + excluded.easy;
+	END`
+];
+
+// Recompute both summary tables from 'cards' and 'revlog'.
+// `run` is a promise-returning query helper; the caller decides the transaction scope.
+async function rebuildSummaries(run) {
+	await run(`DELETE FROM deck_due_counts`);
+	await run(`
+		INSERT INTO deck_due_counts (deck_id, due_day, cards, new_cards)
+		SELECT c.deck_id, c.due / ${SECONDS_PER_DAY}, COUNT(*), SUM(c.interval <= 1)
+		FROM cards c
+		GROUP BY c.deck_id, c.due / ${SECONDS_PER_DAY}
+	`);
+	await run(`DELETE FROM revlog_daily`);
+	await run(`
+		INSERT INTO revlog_daily (day, reviews, time_sum, timed_reviews, again, hard, good, easy)
+		SELECT
+			date(review_time),
+			COUNT(*),
+			SUM(CASE WHEN time_taken > 0 THEN time_taken ELSE 0 END),
+			SUM(CASE WHEN time_taken > 0 THEN 1 ELSE 0 END),
+			SUM(quality = 0), SUM(quality = 1), SUM(quality = 2), SUM(quality = 3)
+		FROM revlog
+		GROUP BY date(review_time)
+	`);
+}
+
+// Create the summary tables and triggers. If the tables did not exist yet
+// (fresh install or upgrade), they are populated from the existing data.
+async function initSummaries(run, all) {
+	const existing = await all(
+		`SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('deck_due_counts', 'revlog_daily')`
+	);
+	for (const statement of SUMMARY_TABLES) {
+		await run(statement);
+	}
+	for (const statement of SUMMARY_TRIGGERS) {
+		await run(statement);
+	}
+	if (existing.length < 2) {
+		logger.info("Populating summary tables from existing cards and revlog...");
+		await rebuildSummaries(run);
+	}
+}
+
+module.exports = {
+	SECONDS_PER_DAY,
+	initSummaries,
+	rebuildSummaries
+};
@@ -0,0 +1,22 @@
+// Worker thread that renders resized variants of an uploaded image (see media.js).
+// Each variant is written to a temporary file and renamed, so a half-written file is never served.
+const fs = require('fs').promises;
+const { parentPort } = require('worker_threads');
+const sharp = require('sharp');
+
+parentPort.on('message', async ({ id, source, variants }) => {
+	try {
+		for (const { target, width } of variants) {
+			const tmp = `${target}.tmp`;
+			await sharp(source)
+				.rotate() // Respect EXIF orientation
+				.resize({ width, height: width, fit: 'inside', withoutEnlargement: true })
+				.webp({ quality: 80 })
+				.toFile(tmp);
+			await fs.rename(tmp, target);
+		}
+		parentPort.postMessage({ id });
+	} catch (error) {
+		parentPort.postMessage({ id, error: error.message });
+	}
+});
@@ -5,6 +5,7 @@ import './App.css';
 import { Deck, Card /*, StatEntry */ } from './types'; // Restored Card
 import Notification from './Notification'; // Import the new component
 import CardBrowser from './CardBrowser'; // Import the new CardBrowser component
+import { enqueueRating, flushRatings, startRatingSync } from './reviewQueue';
 // import { updateCardInDeck, saveData } from './utils'; // REMOVED
 
 // Define StatEntry locally
@@ -41,8 +42,27 @@ interface RecentReviewEntry {
 
 // Define the base URL for the backend API
 const API_BASE_URL = 'http://localhost:5001/api';
+const BROWSE_PAGE_SIZE = 100; // Cards per page in the Card Browser
+const STUDY_ALL_PAGE_SIZE = 100; // Cards fetched at a time in a 'Study All' session
 // const MEDIA_BASE_URL = 'http://localhost:5001'; // REMOVED: Unused
 
+// Position in a 'Study All' session: the deck is listed in the server's seeded shuffle order
+interface StudyAllPager {
+  deckName: string;
+  seed: number;
+  cursor: number | string | null; // nextCursor of the last page, null when all are loaded
+}
+
+// Fetch the page of a 'Study All' session that follows the pager's cursor
+const fetchStudyAllPage = (pager: StudyAllPager) => {
+  const after = pager.cursor === null ? '' : `&after=${pager.cursor}`;
+  return fetch(
+    `${API_BASE_URL}/decks/${encodeURIComponent(
+      pager.deckName
+    )}/cards?shuffle=${pager.seed}&limit=${STUDY_ALL_PAGE_SIZE}${after}`
+  );
+};
+
 // Define possible views
 type View = 'deck-browser' | 'study-session' | 'stats' | 'card-browser';
 
@@ -52,6 +72,8 @@ function App() {
   const [selectedDeck, setSelectedDeck] = useState<string | null>(null); // For studying
   const [browsedDeckName, setBrowsedDeckName] = useState<string | null>(null); // For browsing cards
   const [dueCards, setDueCards] = useState<Card[]>([]); // Cards for current study session
+  // Paging state of a 'Study All' session (null for a due-cards session)
+  const studyAllPager = useRef<StudyAllPager | null>(null);
   const [browseCards, setBrowseCards] = useState<Card[]>([]); // All cards for card browser
   // const [currentCardIndex, setCurrentCardIndex] = useState<number>(0); // REMOVED: Unused
 
@@ -80,6 +102,7 @@ function App() {
   const [isBrowseCardsLoading, setIsBrowseCardsLoading] =
     useState<boolean>(false); // For browse cards
   const [browseCardsError, setBrowseCardsError] = useState<string | null>(null);
+  const [browseCursor, setBrowseCursor] = useState<number | null>(null); // Next page of browse cards
 
   // State for success messages (REMOVED - Use Notification)
   /*
@@ -122,6 +145,8 @@ function App() {
     setIsDecksLoading(true);
     setDecksError(null);
     try {
+      // Send queued ratings first so the due counts are up to date
+      await flushRatings(API_BASE_URL);
       const response = await fetch(`${API_BASE_URL}/decks`);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -142,6 +167,9 @@ function App() {
     }
   }, []);
 
+  // Send queued ratings in the background (and whenever we come back online)
+  useEffect(() => startRatingSync(API_BASE_URL), []);
+
   useEffect(() => {
     if (currentView === 'deck-browser') {
       fetchDecks(); // Fetch decks when returning to browser
@@ -156,6 +184,7 @@ function App() {
     setIsCardsLoading(true);
     setCardsError(null);
     setDueCards([]);
+    studyAllPager.current = null;
     try {
       const response = await fetch(
         `${API_BASE_URL}/decks/${encodeURIComponent(deckName)}/cards/due`
@@ -180,7 +209,7 @@ function App() {
     }
   }, []);
 
-  // Fetch ALL cards when a deck is selected for 'Study All'
+  // Fetch the first page of ALL cards (in a random order) when a deck is selected for 'Study All'
   const startStudyAllSession = useCallback(async (deckName: string) => {
     if (!deckName) return;
     console.log(`Starting study ALL session for: ${deckName}`);
@@ -188,10 +217,15 @@ function App() {
     setIsCardsLoading(true);
     setCardsError(null);
     setDueCards([]); // Reset cards
+    // A fresh seed per session; the server keeps the order stable across its pages
+    const pager: StudyAllPager = {
+      deckName,
+      seed: Math.floor(Math.random() * 2 ** 31),
+      cursor: null,
+    };
+    studyAllPager.current = pager;
     try {
-      const response = await fetch(
-        `${API_BASE_URL}/decks/${encodeURIComponent(deckName)}/cards/all` // Call the new endpoint
-      );
+      const response = await fetchStudyAllPage(pager);
       if (!response.ok) {
         if (response.status === 404) {
           setCardsError(`Deck '${deckName}' not found on backend.`);
@@ -200,9 +234,11 @@ function App() {
         }
         throw new Error(`HTTP error! status: ${response.status}`);
       }
-      const data: Card[] = await response.json();
-      setDueCards(data);
-      console.log(`Loaded ${data.length} total cards for Study All.`);
+      const data: { cards: Card[]; nextCursor: number | string | null } =
+        await response.json();
+      pager.cursor = data.nextCursor;
+      setDueCards(data.cards);
+      console.log(`Loaded the first ${data.cards.length} cards for Study All.`);
       setCurrentView('study-session'); // Switch view only after successful load
     } catch (e: any) {
       console.error('Failed to fetch all cards:', e);
@@ -212,6 +248,24 @@ function App() {
     }
   }, []); // Dependencies: API_BASE_URL (constant), other setters
 
+  // Fetch the next page of the current 'Study All' session; resolves with [] when there is none
+  const loadMoreStudyCards = useCallback(async (): Promise<Card[]> => {
+    const pager = studyAllPager.current;
+    if (!pager || pager.cursor === null) return [];
+    try {
+      const response = await fetchStudyAllPage(pager);
+      if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+      const data: { cards: Card[]; nextCursor: number | string | null } =
+        await response.json();
+      if (studyAllPager.current !== pager) return []; // Session changed meanwhile
+      pager.cursor = data.nextCursor;
+      return data.cards;
+    } catch (e: any) {
+      console.error('Failed to fetch more cards:', e);
+      return [];
+    }
+  }, []);
+
   // Helper function to show a temporary success message (REMOVED - Use Notification)
   /*
   const showSuccessMessage = (message: string, type: 'deck' | 'card') => {
@@ -357,30 +411,16 @@ function App() {
       `Rating card ID ${cardId} in deck ${deckName} with quality ${quality}, time: ${elapsedTimeMs}ms`
     );
 
+    // Queue the rating locally and send it in the background.
+    // The queue is persisted, so a rating survives a dropped connection.
     try {
-      const response = await fetch(
-        `${API_BASE_URL}/decks/${encodeURIComponent(
-          deckName
-        )}/cards/${cardId}/rate`,
-        {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ quality, timeTakenMs: elapsedTimeMs }),
-        }
-      );
-
-      if (!response.ok) {
-        const errorData = await response
-          .json()
-          .catch(() => ({ error: `Server error: ${response.statusText}` }));
-        throw new Error(
-          errorData.error || `Failed to rate card: ${response.statusText}`
-        );
-      }
-
-      const result = await response.json();
-      console.log(`Card ${cardId} rated successfully:`, result.message);
-
+      enqueueRating({
+        deckName,
+        cardId,
+        quality,
+        timeTakenMs: elapsedTimeMs ?? null,
+      });
+      flushRatings(API_BASE_URL);
       return true; // Indicate success
     } catch (err: any) {
       console.error('Rate card error:', err);
@@ -446,7 +486,9 @@ function App() {
     setSelectedDeck(null); // Clear study deck
     setBrowsedDeckName(null); // Clear browsed deck
     setDueCards([]);
+    studyAllPager.current = null;
     setBrowseCards([]); // Clear browse cards
+    setBrowseCursor(null);
     setStatsSummary(null); // Clear stats state
     setRecentReviews([]);
     setCardsError(null);
@@ -462,9 +504,10 @@ function App() {
     setIsBrowseCardsLoading(true);
     setBrowseCardsError(null);
     setBrowseCards([]);
+    setBrowseCursor(null);
     try {
       const response = await fetch(
-        `${API_BASE_URL}/decks/${encodeURIComponent(deckName)}/cards/all` // Fetch all cards
+        `${API_BASE_URL}/decks/${encodeURIComponent(deckName)}/cards?limit=${BROWSE_PAGE_SIZE}` // First page only
       );
       if (!response.ok) {
         if (response.status === 404) {
@@ -474,9 +517,11 @@ function App() {
         }
         throw new Error(`HTTP error! status: ${response.status}`);
       }
-      const data: Card[] = await response.json();
-      setBrowseCards(data);
-      console.log(`Loaded ${data.length} cards for browsing.`);
+      const data: { cards: Card[]; nextCursor: number | null } =
+        await response.json();
+      setBrowseCards(data.cards);
+      setBrowseCursor(data.nextCursor);
+      console.log(`Loaded ${data.cards.length} cards for browsing.`);
       setCurrentView('card-browser'); // Switch view
     } catch (e: any) {
       console.error('Failed to fetch cards for browsing:', e);
@@ -486,6 +531,28 @@ function App() {
     }
   }, []);
 
+  // Handler to fetch the next page of cards in the Card Browser
+  const handleLoadMoreBrowseCards = useCallback(async () => {
+    if (!browsedDeckName || browseCursor === null) return;
+    try {
+      const response = await fetch(
+        `${API_BASE_URL}/decks/${encodeURIComponent(
+          browsedDeckName
+        )}/cards?limit=${BROWSE_PAGE_SIZE}&after=${browseCursor}`
+      );
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const data: { cards: Card[]; nextCursor: number | null } =
+        await response.json();
+      setBrowseCards((prevCards) => [...prevCards, ...data.cards]);
+      setBrowseCursor(data.nextCursor);
+    } catch (e: any) {
+      console.error('Failed to fetch more cards:', e);
+      showNotification('Failed to load more cards.', 'error');
+    }
+  }, [browsedDeckName, browseCursor, showNotification]);
+
   // Handler to delete a specific card
   const handleDeleteCard = async (
     deckName: string,
@@ -610,6 +677,7 @@ function App() {
             onRateCard={handleRateCard}
             onGoBack={handleGoToDecks}
             onStudyAll={startStudyAllSession}
+            onLoadMore={loadMoreStudyCards}
             onUpdateCard={(cardId, data) =>
               handleUpdateCard(selectedDeck, cardId, data)
             }
@@ -631,6 +699,8 @@ function App() {
             onAddCard={handleAddCard}
             onGoBack={handleGoToDecks}
             onUploadFile={handleFileUpload}
+            hasMore={browseCursor !== null}
+            onLoadMore={handleLoadMoreBrowseCards}
           />
         );
       case 'stats':
@@ -2,6 +2,8 @@ import React, { useState, useRef, useEffect } from 'react';
 import { Card } from './types';
 import { Excalidraw } from '@excalidraw/excalidraw';
 import QuickAddExcalidraw from './QuickAddExcalidraw';
+import { resolveContent } from './blobs';
+import { mediaUrl } from './media';
 // import { ExcalidrawImperativeAPI } from '@excalidraw/excalidraw'; // If specific API access needed
 
 interface CardBrowserProps {
@@ -31,6 +33,8 @@ interface CardBrowserProps {
   ) => Promise<boolean>;
   onGoBack: () => void;
   onUploadFile?: (file: File) => Promise<string | null>; // Add for image uploads
+  hasMore?: boolean; // More pages of cards are available
+  onLoadMore?: () => void;
 }
 
 const CardBrowser: React.FC<CardBrowserProps> = ({
@@ -43,6 +47,8 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
   onAddCard,
   onGoBack,
   onUploadFile, // Destructure
+  hasMore,
+  onLoadMore,
 }) => {
   // --- State for Edit Modal ---
   const [showEditModal, setShowEditModal] = useState<boolean>(false);
@@ -107,11 +113,13 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
   };
 
   // --- Excalidraw Logic (adapted for edit modal state) ---
-  const openExcalidraw = (side: 'front' | 'back') => {
+  const openExcalidraw = async (side: 'front' | 'back') => {
     setExcalidrawEditingSide(side);
-    const currentContent =
-      side === 'front' ? editFrontContent : editBackContent;
     try {
+      // Stored drawings are blob references; fetch the scene before editing
+      const currentContent = await resolveContent(
+        side === 'front' ? editFrontContent : editBackContent
+      );
       if (currentContent) {
         const parsedData = JSON.parse(currentContent);
         setExcalidrawInitialElements(parsedData?.elements || []);
@@ -250,7 +258,7 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
                       {card.front_type === 'text' && card.front_content}
                       {card.front_type === 'image' && onUploadFile && (
                         <img
-                          src={`/uploads/${card.front_content}`}
+                          src={mediaUrl(card.front_content, 'thumb')}
                           alt="Front"
                           className="thumbnail-preview"
                         />
@@ -264,7 +272,7 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
                       {card.back_type === 'text' && card.back_content}
                       {card.back_type === 'image' && onUploadFile && (
                         <img
-                          src={`/uploads/${card.back_content}`}
+                          src={mediaUrl(card.back_content, 'thumb')}
                           alt="Back"
                           className="thumbnail-preview"
                         />
@@ -305,6 +313,15 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
               </tbody>
             </table>
           )}
+          {hasMore && onLoadMore && (
+            <button
+              onClick={onLoadMore}
+              className="anki-button anki-button-secondary"
+              style={{ marginTop: 10 }}
+            >
+              Load More
+            </button>
+          )}
         </div>
       )}
 
@@ -346,7 +363,7 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
                     />
                     {editFrontContent && (
                       <img
-                        src={`/uploads/${editFrontContent}`}
+                        src={mediaUrl(editFrontContent, 'thumb')}
                         alt="Preview"
                         className="image-preview"
                       />
@@ -407,7 +424,7 @@ const CardBrowser: React.FC<CardBrowserProps> = ({
                     />
                     {editBackContent && (
                       <img
-                        src={`/uploads/${editBackContent}`}
+                        src={mediaUrl(editBackContent, 'thumb')}
                         alt="Preview"
                         className="image-preview"
                       />
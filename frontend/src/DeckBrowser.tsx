@@ -1,5 +1,6 @@
 import React, { useState, useRef } from 'react';
 import { Deck } from './types'; // Импортируем тип Deck
+import { mediaUrl } from './media';
 // Import the library itself and types directly if exported
 // Could not resolve types automatically, using 'any' temporarily
 // import { ExcalidrawElement, AppState, ExcalidrawImperativeAPI } from '@excalidraw/excalidraw';
@@ -362,7 +363,7 @@ const DeckBrowser: React.FC<DeckBrowserProps> = (props) => {
                     />
                     {frontContent && (
                       <img
-                        src={`/uploads/${frontContent}`}
+                        src={mediaUrl(frontContent, 'thumb')}
                         alt="Preview"
                         className="image-preview"
                       />
@@ -415,7 +416,7 @@ const DeckBrowser: React.FC<DeckBrowserProps> = (props) => {
                     />
                     {backContent && (
                       <img
-                        src={`/uploads/${backContent}`}
+                        src={mediaUrl(backContent, 'thumb')}
                         alt="Preview"
                         className="image-preview"
                       />
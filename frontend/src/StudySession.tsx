@@ -1,5 +1,7 @@
 import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { Card } from './types';
+import { isBlobRef, resolveContent } from './blobs';
+import { mediaUrl } from './media';
 
 // Import Excalidraw directly
 import { Excalidraw } from '@excalidraw/excalidraw';
@@ -19,6 +21,8 @@ interface StudySessionProps {
   ) => Promise<boolean>;
   onGoBack: () => void;
   onStudyAll?: (deckName: string) => void;
+  // Fetches the next cards of a paged session; resolves with [] when there are no more
+  onLoadMore?: () => Promise<Card[]>;
   onUpdateCard: (
     cardId: string | number,
     updatedCardData: {
@@ -39,6 +43,7 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
     onRateCard,
     onGoBack,
     onStudyAll,
+    onLoadMore,
     onUpdateCard,
   } = props;
 
@@ -50,6 +55,9 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
   const [elapsedTime, setElapsedTime] = useState<number | null>(null);
   // Local copy of cards for the session to allow reordering
   const [sessionCards, setSessionCards] = useState<Card[]>([]);
+  // Paged sessions: the request for the next cards in flight, and whether any are left
+  const loadingMoreRef = useRef<Promise<Card[]> | null>(null);
+  const hasMoreRef = useRef<boolean>(true);
 
   // State for Edit Modal (RESTORED)
   const [showEditModal, setShowEditModal] = useState<boolean>(false);
@@ -58,9 +66,16 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
   const [editingError, setEditingError] = useState<string | null>(null);
   const editExcalidrawApiRef = useRef<any | null>(null); // Ref for Excalidraw API in modal
 
+  // Drawings fetched from the blob store, keyed by their 'blob:<hash>' reference
+  const [resolvedBlobs, setResolvedBlobs] = useState<Record<string, string>>(
+    {}
+  );
+
   // Initialize/Reset session cards and state when props.cards changes
   useEffect(() => {
     setSessionCards([...initialCards]);
+    loadingMoreRef.current = null;
+    hasMoreRef.current = true;
     setCurrentCardIndex(0);
     setShowingAnswer(false);
     setStartTime(Date.now());
@@ -79,6 +94,44 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
     // handleRateClick should have handled session end.
   }, [currentCardIndex, sessionCards]); // Depend on sessionCards as well
 
+  // Append the next cards of a paged session (one request at a time). Resolves with the new cards.
+  const loadMoreCards = useCallback((): Promise<Card[]> => {
+    if (!onLoadMore || !hasMoreRef.current) return Promise.resolve([]);
+    if (!loadingMoreRef.current) {
+      const request = onLoadMore().then((more) => {
+        if (loadingMoreRef.current !== request) return []; // Session was reset meanwhile
+        loadingMoreRef.current = null;
+        if (more.length === 0) hasMoreRef.current = false;
+        setSessionCards((prev) => [...prev, ...more]);
+        return more;
+      });
+      loadingMoreRef.current = request;
+    }
+    return loadingMoreRef.current;
+  }, [onLoadMore]);
+
+  // Prefetch the next page while a few cards of the current one are still left
+  useEffect(() => {
+    if (sessionCards.length > 0 && sessionCards.length - currentCardIndex <= 10) {
+      loadMoreCards();
+    }
+  }, [currentCardIndex, sessionCards.length, loadMoreCards]);
+
+  // Fetch the drawings of the current and next card (the next one is prefetched)
+  useEffect(() => {
+    const refs = sessionCards
+      .slice(currentCardIndex, currentCardIndex + 2)
+      .flatMap((card) => [card.front_content, card.back_content])
+      .filter((content) => isBlobRef(content) && !(content in resolvedBlobs));
+    refs.forEach((ref) => {
+      resolveContent(ref)
+        .then((content) =>
+          setResolvedBlobs((prev) => ({ ...prev, [ref]: content }))
+        )
+        .catch((e) => console.error('Error loading drawing:', e));
+    });
+  }, [currentCardIndex, sessionCards, resolvedBlobs]);
+
   const handleShowAnswerClick = useCallback(() => {
     if (!showingAnswer && startTime) {
       const elapsed = Date.now() - startTime;
@@ -105,7 +158,11 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
             (_, index) => index !== currentCardIndex
           );
           newSessionCards.push(cardToMove);
-          setSessionCards(newSessionCards);
+          // Keep any cards a paged session appended since this render
+          setSessionCards((prev) => [
+            ...newSessionCards,
+            ...prev.slice(sessionCards.length),
+          ]);
 
           // Index remains the same, but points to the *next* card now
           // Check if we were already at the end (relative to the *original* size before moving)
@@ -124,6 +181,8 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
           const nextIndex = currentCardIndex + 1;
           if (nextIndex < sessionCards.length) {
             setCurrentCardIndex(nextIndex); // Will trigger useEffect to reset timer
+          } else if ((await loadMoreCards()).length > 0) {
+            setCurrentCardIndex(nextIndex); // Next page has been appended
           } else {
             // Session finished!
             console.log('Session finished normally');
@@ -142,6 +201,7 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
       elapsedTime,
       onGoBack,
       setSessionCards,
+      loadMoreCards,
     ]
   );
 
@@ -199,7 +259,7 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
         `Opening edit modal for ${sideToEdit} side of card ${currentCard.id}`
       );
       setEditingSide(sideToEdit);
-      setEditingContent(content); // Load current Excalidraw JSON into state
+      setEditingContent(resolvedBlobs[content] ?? content); // Load current Excalidraw JSON into state
       setEditingError(null);
       setShowEditModal(true);
     } else {
@@ -271,10 +331,8 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
     type: 'text' | 'image' | 'excalidraw',
     content: string
   ) => {
-    const MEDIA_BASE_URL = 'http://localhost:5001';
-
     if (type === 'image') {
-      const imageUrl = `${MEDIA_BASE_URL}/media/${encodeURIComponent(content)}`;
+      const imageUrl = mediaUrl(content, 'display');
       return (
         <img
           src={imageUrl}
@@ -283,6 +341,12 @@ const StudySession: React.FC<StudySessionProps> = (props) => {
         />
       );
     } else if (type === 'excalidraw') {
+      if (isBlobRef(content)) {
+        if (!(content in resolvedBlobs)) {
+          return <p>Loading drawing...</p>;
+        }
+        content = resolvedBlobs[content];
+      }
       try {
         const excalidrawProps = JSON.parse(content);
         const key = content; // Use content string as key to force re-mount on change
@@ -0,0 +1,32 @@
+// Excalidraw scenes are stored server-side as content-addressed blobs.
+// Card content then holds a 'blob:<sha256>' reference that is fetched on demand.
+// Blobs are immutable, so fetched content is cached for the lifetime of the page
+// (and by the browser, which gets 'Cache-Control: immutable' from the backend).
+
+const BLOB_BASE_URL = 'http://localhost:5001/api/blobs';
+const BLOB_REF_PREFIX = 'blob:';
+
+const blobCache = new Map<string, Promise<string>>();
+
+export const isBlobRef = (content: string): boolean =>
+  content.startsWith(BLOB_REF_PREFIX);
+
+// Returns the blob content for a reference, or `content` itself if it is not one
+export const resolveContent = (content: string): Promise<string> => {
+  if (!isBlobRef(content)) return Promise.resolve(content);
+
+  const hash = content.slice(BLOB_REF_PREFIX.length);
+  let pending = blobCache.get(hash);
+  if (!pending) {
+    pending = fetch(`${BLOB_BASE_URL}/${hash}`).then((response) => {
+      if (!response.ok) {
+        throw new Error(`Failed to load drawing: status ${response.status}`);
+      }
+      return response.text();
+    });
+    // Do not cache failures, so a later render can retry
+    pending.catch(() => blobCache.delete(hash));
+    blobCache.set(hash, pending);
+  }
+  return pending;
+};
@@ -0,0 +1,14 @@
+// URLs for uploaded images. The backend serves resized WebP variants
+// ('thumb' for lists, 'display' for study) and falls back to the original
+// until the variant has been generated.
+
+const MEDIA_BASE_URL = 'http://localhost:5001/media';
+
+export type MediaVariant = 'original' | 'thumb' | 'display';
+
+export const mediaUrl = (filename: string, variant: MediaVariant = 'original'): string => {
+  const name = encodeURIComponent(filename);
+  return variant === 'original'
+    ? `${MEDIA_BASE_URL}/${name}`
+    : `${MEDIA_BASE_URL}/${variant}/${name}`;
+};
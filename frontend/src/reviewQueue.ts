@@ -0,0 +1,141 @@
+// Offline-safe queue of card ratings.
+// Ratings are persisted to localStorage and sent to the backend in batches,
+// so a rating is never lost if the network drops mid-session.
+
+export interface PendingRating {
+  deckName: string;
+  cardId: number | string;
+  quality: number;
+  timeTakenMs: number | null;
+  reviewedAt: string; // ISO8601, also used by the backend to ignore resent ratings
+}
+
+const STORAGE_KEY = 'flashcards.pendingRatings';
+const MAX_BATCH_SIZE = 500; // Must not exceed the backend's MAX_RATING_BATCH_SIZE
+
+let flushInProgress: Promise<boolean> | null = null;
+
+const loadQueue = (): PendingRating[] => {
+  try {
+    const raw = localStorage.getItem(STORAGE_KEY);
+    return raw ? JSON.parse(raw) : [];
+  } catch (e) {
+    console.error('Failed to read pending ratings:', e);
+    return [];
+  }
+};
+
+const saveQueue = (queue: PendingRating[]) => {
+  localStorage.setItem(STORAGE_KEY, JSON.stringify(queue));
+};
+
+const sameRating = (a: PendingRating, b: PendingRating) =>
+  a.cardId === b.cardId && a.reviewedAt === b.reviewedAt;
+
+// Remove the given ratings from storage, keeping anything queued meanwhile
+const removeFromQueue = (sent: PendingRating[]) => {
+  saveQueue(loadQueue().filter((r) => !sent.some((s) => sameRating(r, s))));
+};
+
+export const pendingRatingCount = (): number => loadQueue().length;
+
+export const enqueueRating = (
+  rating: Omit<PendingRating, 'reviewedAt'>
+): PendingRating => {
+  const pending = { ...rating, reviewedAt: new Date().toISOString() };
+  saveQueue([...loadQueue(), pending]);
+  return pending;
+};
+
+const sendBatch = async (
+  apiBaseUrl: string,
+  deckName: string,
+  batch: PendingRating[]
+): Promise<boolean> => {
+  const response = await fetch(
+    `${apiBaseUrl}/decks/${encodeURIComponent(deckName)}/cards/rate-batch`,
+    {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        ratings: batch.map(({ cardId, quality, timeTakenMs, reviewedAt }) => ({
+          cardId,
+          quality,
+          timeTakenMs,
+          reviewedAt,
+        })),
+      }),
+    }
+  );
+  if (response.ok) {
+    removeFromQueue(batch);
+    return true;
+  }
+  if (response.status === 400 || response.status === 404) {
+    // Retrying will never succeed (e.g. the deck was deleted), so drop them
+    console.error(
+      `Dropping ${batch.length} ratings for deck '${deckName}': status ${response.status}`
+    );
+    removeFromQueue(batch);
+    return true;
+  }
+  return false;
+};
+
+// Send all queued ratings, grouped by deck. Resolves to true when the queue was drained.
+// Concurrent callers share the same flush.
+export const flushRatings = (apiBaseUrl: string): Promise<boolean> => {
+  if (flushInProgress) return flushInProgress;
+
+  flushInProgress = (async () => {
+    const queue = loadQueue();
+    const byDeck = new Map<string, PendingRating[]>();
+    queue.forEach((rating) => {
+      byDeck.set(rating.deckName, [
+        ...(byDeck.get(rating.deckName) || []),
+        rating,
+      ]);
+    });
+
+    let drained = true;
+    for (const [deckName, ratings] of Array.from(byDeck.entries())) {
+      for (let i = 0; i < ratings.length; i += MAX_BATCH_SIZE) {
+        try {
+          const ok = await sendBatch(
+            apiBaseUrl,
+            deckName,
+            ratings.slice(i, i + MAX_BATCH_SIZE)
+          );
+          if (!ok) drained = false;
+        } catch (e) {
+          // Network error: keep the ratings and retry on the next flush
+          console.warn('Failed to send ratings, will retry:', e);
+          drained = false;
+        }
+      }
+    }
+    return drained;
+  })().finally(() => {
+    flushInProgress = null;
+  });
+
+  return flushInProgress;
+};
+
+// Flush periodically and whenever the browser comes back online.
+// Returns a cleanup function for use in a React effect.
+export const startRatingSync = (
+  apiBaseUrl: string,
+  intervalMs: number = 5000
+): (() => void) => {
+  const flush = () => {
+    if (pendingRatingCount() > 0) flushRatings(apiBaseUrl);
+  };
+  const timer = window.setInterval(flush, intervalMs);
+  window.addEventListener('online', flush);
+  flush();
+  return () => {
+    window.clearInterval(timer);
+    window.removeEventListener('online', flush);
+  };
+};
@@ -5,6 +5,7 @@ export interface Card {
 	back_type: 'text' | 'image' | 'excalidraw';
 	back_content: string;
 	due_date: string;
+	due: number; // Unix epoch seconds
 	interval: number;
 	ease_factor: number;
 }